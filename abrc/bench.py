@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""bench: time `abrc filter` (JSON lines) against `abrc bulk` (framed binary) on synthetic requests
+
+Both modes get the same requests; the verdicts must agree.
+"""
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import time
+from typing import List, Sequence, Tuple
+
+ABRC_EXE = os.environ.get("ABRC_EXE", os.path.join(os.path.dirname(__file__), "target", "release", "abrc"))
+REQUESTS = int(os.environ.get("REQUESTS", 2_000_000))
+HOSTS = int(os.environ.get("HOSTS", 5000))
+THREADS = os.environ.get("THREADS")
+SEED = int(os.environ.get("SEED", 42))
+
+REQUEST_TYPES = ["script", "image", "sub_frame", "xmlhttprequest", "stylesheet"]
+
+Request = Tuple[str, str, str]
+
+
+def synthetic_requests(count: int, hosts: int, seed: int) -> List[Request]:
+    rng = random.Random(seed)
+    names = [f"{rng.choice(['ads', 'cdn', 'static', 'track', 'www'])}{i}.example{i % 97}.com" for i in range(hosts)]
+    return [
+        (
+            f"https://{rng.choice(names)}/{rng.choice(['ad', 'js', 'img', 'pixel'])}/{rng.randrange(1 << 20)}",
+            f"https://{rng.choice(names)}/",
+            rng.choice(REQUEST_TYPES),
+        )
+        for _ in range(count)
+    ]
+
+
+def pack_bulk_requests(requests: Sequence[Request]) -> bytes:
+    chunks = []
+    for i, fields in enumerate(requests):
+        chunks.append(struct.pack("<I", i))
+        for field in fields:
+            raw = field.encode("utf8")
+            chunks.append(struct.pack("<I", len(raw)))
+            chunks.append(raw)
+    return b"".join(chunks)
+
+
+def unpack_bulk_results(blob: bytes) -> List[bool]:
+    results = []
+    for expected, (rid, matched) in enumerate(struct.iter_unpack("<IB", blob)):
+        if rid != expected:
+            raise ValueError(f"result {expected} came back with id {rid}")
+        results.append(bool(matched))
+    return results
+
+
+def run_json(filterset: str, requests: Sequence[Request]) -> List[bool]:
+    json_input = "".join(json.dumps({"url": u, "source_url": s, "request_type": t}) + "\n" for u, s, t in requests)
+    proc = subprocess.run([ABRC_EXE, "filter", "-f", filterset], input=json_input, capture_output=True, check=True, encoding="utf8")
+    return list(map(json.loads, proc.stdout.split()))
+
+
+def run_bulk(filterset: str, requests: Sequence[Request]) -> List[bool]:
+    argv = [ABRC_EXE, "bulk", "-f", filterset] + (["-j", THREADS] if THREADS else [])
+    proc = subprocess.run(argv, input=pack_bulk_requests(requests), capture_output=True, check=True)
+    return unpack_bulk_results(proc.stdout)
+
+
+def main(argv):
+    try:
+        filterset = argv[1]
+    except IndexError:
+        print(f"usage: {argv[0]} FILTERSET_DAT")
+        return
+
+    requests = synthetic_requests(REQUESTS, HOSTS, SEED)
+    verdicts = {}
+    for mode, runner in [("filter", run_json), ("bulk", run_bulk)]:
+        start = time.perf_counter()
+        verdicts[mode] = runner(filterset, requests)
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>6}: {len(requests):,} requests in {elapsed:.2f}s ({len(requests) / elapsed:,.0f}/s)")
+
+    if verdicts["filter"] != verdicts["bulk"]:
+        raise ValueError("filter and bulk verdicts differ")
+    print(f"verdicts agree ({sum(verdicts['bulk']):,} matched)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
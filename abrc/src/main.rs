@@ -1,10 +1,17 @@
 use adblock::engine::Engine;
 use adblock::lists::FilterFormat;
 use adblock::utils::rules_from_lists;
-use clap::{App, Arg, SubCommand};
+use clap::{App, Arg, ArgMatches, SubCommand};
+use memmap2::Mmap;
+use std::collections::BTreeMap;
 use std::fs::File;
 use std::io::prelude::*;
+use std::io::{self, BufReader, BufWriter};
+use std::os::unix::net::{UnixListener, UnixStream};
 use std::str::FromStr;
+use std::sync::mpsc::{sync_channel, SyncSender};
+use std::sync::{Arc, Mutex};
+use std::thread;
 use serde::Deserialize;
 
 #[derive(Deserialize, Debug)]
@@ -14,6 +21,226 @@ struct FilterRequest {
     request_type: String,
 }
 
+/// map a baked filterset into memory instead of copying it onto the heap
+fn map_filterset(filterset_file: &str) -> Mmap {
+    let file = File::open(filterset_file).expect("unable to open filterset file");
+    unsafe { Mmap::map(&file) }.expect("unable to map filterset file")
+}
+
+fn load_engine(filterset_blob: &[u8]) -> Engine {
+    let mut engine = Engine::new(false);
+    engine.deserialize(filterset_blob).expect("unable to deserialize filterset file");
+    engine
+}
+
+fn thread_count(matches: &ArgMatches) -> usize {
+    match matches.value_of("threads") {
+        Some(n) => n.parse::<usize>().expect("invalid thread count").max(1),
+        None => thread::available_parallelism().map(|n| n.get()).unwrap_or(1),
+    }
+}
+
+/// requests handed to a bulk worker thread at a time
+const BULK_CHUNK: usize = 4096;
+
+/// bulk-mode request record: u32 id, then url, source_url and request_type, each as
+/// a u32 byte length followed by that many bytes of UTF-8 (all integers little-endian)
+struct BulkRequest {
+    id: u32,
+    url: String,
+    source_url: String,
+    request_type: String,
+}
+
+fn read_u32<R: Read>(reader: &mut R) -> io::Result<u32> {
+    let mut buf = [0u8; 4];
+    reader.read_exact(&mut buf)?;
+    Ok(u32::from_le_bytes(buf))
+}
+
+fn read_string<R: Read>(reader: &mut R) -> io::Result<String> {
+    let mut buf = vec![0u8; read_u32(reader)? as usize];
+    reader.read_exact(&mut buf)?;
+    String::from_utf8(buf).map_err(|oops| io::Error::new(io::ErrorKind::InvalidData, oops))
+}
+
+/// next request record, or None at a clean end of input
+fn read_bulk_request<R: Read>(reader: &mut R) -> io::Result<Option<BulkRequest>> {
+    let id = match read_u32(reader) {
+        Ok(id) => id,
+        Err(ref oops) if oops.kind() == io::ErrorKind::UnexpectedEof => return Ok(None),
+        Err(oops) => return Err(oops),
+    };
+    Ok(Some(BulkRequest {
+        id,
+        url: read_string(reader)?,
+        source_url: read_string(reader)?,
+        request_type: read_string(reader)?,
+    }))
+}
+
+/// filter framed requests from stdin on `threads` workers, writing (u32 id, u8 matched)
+/// results to stdout in input order
+///
+/// Each worker deserializes its own Engine from the one shared filterset blob (Engine
+/// is not Sync, and deserializing is cheap next to millions of lookups).
+fn bulk_filter(filterset_blob: Arc<Mmap>, threads: usize) -> io::Result<()> {
+    let (work_tx, work_rx) = sync_channel::<(usize, Vec<BulkRequest>)>(threads * 2);
+    let work_rx = Arc::new(Mutex::new(work_rx));
+    let (done_tx, done_rx) = sync_channel::<(usize, Vec<(u32, bool)>)>(threads * 2);
+
+    let workers: Vec<_> = (0..threads)
+        .map(|_| {
+            let filterset_blob = Arc::clone(&filterset_blob);
+            let work_rx = Arc::clone(&work_rx);
+            let done_tx = done_tx.clone();
+            thread::spawn(move || {
+                let engine = load_engine(&filterset_blob);
+                loop {
+                    let job = work_rx.lock().unwrap().recv();
+                    let (seq, batch) = match job {
+                        Ok(job) => job,
+                        Err(_) => break,
+                    };
+                    let results = batch
+                        .iter()
+                        .map(|r| (r.id, engine.check_network_urls(&r.url, &r.source_url, &r.request_type).matched))
+                        .collect();
+                    if done_tx.send((seq, results)).is_err() {
+                        break;
+                    }
+                }
+            })
+        })
+        .collect();
+    drop(done_tx);
+
+    let reader = thread::spawn(move || -> io::Result<()> {
+        let stdin = io::stdin();
+        let mut input = BufReader::with_capacity(1 << 16, stdin.lock());
+        let mut seq = 0;
+        let mut batch = Vec::with_capacity(BULK_CHUNK);
+        while let Some(request) = read_bulk_request(&mut input)? {
+            batch.push(request);
+            if batch.len() == BULK_CHUNK {
+                work_tx.send((seq, batch)).expect("bulk workers exited early");
+                seq += 1;
+                batch = Vec::with_capacity(BULK_CHUNK);
+            }
+        }
+        if !batch.is_empty() {
+            work_tx.send((seq, batch)).expect("bulk workers exited early");
+        }
+        Ok(())
+    });
+
+    // batches finish out of order; hold them until every earlier one has been written
+    let stdout = io::stdout();
+    let mut output = BufWriter::with_capacity(1 << 16, stdout.lock());
+    let mut pending = BTreeMap::new();
+    let mut next_seq = 0;
+    for (seq, results) in done_rx {
+        pending.insert(seq, results);
+        while let Some(results) = pending.remove(&next_seq) {
+            for (id, matched) in results {
+                output.write_all(&id.to_le_bytes())?;
+                output.write_all(&[matched as u8])?;
+            }
+            next_seq += 1;
+        }
+    }
+    output.flush()?;
+
+    for worker in workers {
+        worker.join().expect("bulk worker panicked");
+    }
+    reader.join().expect("bulk reader panicked")
+}
+
+/// a batch of requests from one connection, and where to send its results
+type ServeJob = (Vec<BulkRequest>, SyncSender<Vec<(u32, bool)>>);
+
+/// hex SHA-1 of the filterset bytes, so clients can tell which filterset answered them
+fn filterset_digest(filterset_blob: &[u8]) -> String {
+    sha1_smol::Sha1::from(filterset_blob).digest().to_string()
+}
+
+/// answer batches on one `serve` connection until the client hangs up
+///
+/// The connection opens with a greeting from us: the loaded filterset's digest, as a
+/// u32 byte length followed by that many bytes of ASCII hex.  After that, a batch is a
+/// u32 request count followed by that many BulkRequest records; the reply is that many
+/// (u32 id, u8 matched) results, flushed once per batch.
+fn serve_connection(stream: UnixStream, job_tx: SyncSender<ServeJob>, digest: Arc<String>) -> io::Result<()> {
+    let mut input = BufReader::new(stream.try_clone()?);
+    let mut output = BufWriter::new(stream);
+    output.write_all(&(digest.len() as u32).to_le_bytes())?;
+    output.write_all(digest.as_bytes())?;
+    output.flush()?;
+    let (result_tx, result_rx) = sync_channel(1);
+    loop {
+        let count = match read_u32(&mut input) {
+            Ok(count) => count,
+            Err(ref oops) if oops.kind() == io::ErrorKind::UnexpectedEof => return Ok(()),
+            Err(oops) => return Err(oops),
+        };
+        // the count comes off the wire: don't let a garbled one size the allocation
+        let mut batch = Vec::with_capacity((count as usize).min(BULK_CHUNK));
+        for _ in 0..count {
+            batch.push(
+                read_bulk_request(&mut input)?
+                    .ok_or_else(|| io::Error::new(io::ErrorKind::UnexpectedEof, "truncated request batch"))?,
+            );
+        }
+        job_tx.send((batch, result_tx.clone())).expect("serve workers exited");
+        for (id, matched) in result_rx.recv().expect("serve workers exited") {
+            output.write_all(&id.to_le_bytes())?;
+            output.write_all(&[matched as u8])?;
+        }
+        output.flush()?;
+    }
+}
+
+/// keep `threads` engines resident; every connection gets a (cheap) reader thread that
+/// passes its batches to whichever engine is free
+fn serve_forever(listener: UnixListener, filterset_blob: Arc<Mmap>, threads: usize) {
+    let digest = Arc::new(filterset_digest(&filterset_blob));
+    let (job_tx, job_rx) = sync_channel::<ServeJob>(threads * 2);
+    let job_rx = Arc::new(Mutex::new(job_rx));
+    for _ in 0..threads {
+        let filterset_blob = Arc::clone(&filterset_blob);
+        let job_rx = Arc::clone(&job_rx);
+        thread::spawn(move || {
+            let engine = load_engine(&filterset_blob);
+            loop {
+                let (batch, result_tx) = match job_rx.lock().unwrap().recv() {
+                    Ok(job) => job,
+                    Err(_) => break,
+                };
+                let results = batch
+                    .iter()
+                    .map(|r| (r.id, engine.check_network_urls(&r.url, &r.source_url, &r.request_type).matched))
+                    .collect();
+                let _ = result_tx.send(results);
+            }
+        });
+    }
+    for stream in listener.incoming() {
+        match stream {
+            Ok(stream) => {
+                let job_tx = job_tx.clone();
+                let digest = Arc::clone(&digest);
+                thread::spawn(move || {
+                    if let Err(oops) = serve_connection(stream, job_tx, digest) {
+                        eprintln!("error serving connection: {0:?}", oops)
+                    }
+                });
+            }
+            Err(oops) => eprintln!("error accepting connection: {0:?}", oops),
+        }
+    }
+}
+
 fn main() {
     let cli = App::new("ABRaCadabra: adblock-rust CLI tool")
         .version("0.1")
@@ -48,6 +275,52 @@ fn main() {
                         .help("load filterset from FILE")
                         .default_value("filterset.dat"),
                 ),
+        )
+        .subcommand(
+            SubCommand::with_name("bulk")
+                .about("filter length-prefixed binary requests on several threads (see BulkRequest)")
+                .arg(
+                    Arg::with_name("filterset")
+                        .short("f")
+                        .long("filterset")
+                        .value_name("FILE")
+                        .help("load filterset from FILE")
+                        .default_value("filterset.dat"),
+                )
+                .arg(
+                    Arg::with_name("threads")
+                        .short("j")
+                        .long("threads")
+                        .value_name("N")
+                        .help("number of worker threads (default: one per CPU)"),
+                ),
+        )
+        .subcommand(
+            SubCommand::with_name("serve")
+                .about("keep a filterset resident and answer batched bulk requests on a Unix socket")
+                .arg(
+                    Arg::with_name("filterset")
+                        .short("f")
+                        .long("filterset")
+                        .value_name("FILE")
+                        .help("load filterset from FILE")
+                        .default_value("filterset.dat"),
+                )
+                .arg(
+                    Arg::with_name("socket")
+                        .short("s")
+                        .long("socket")
+                        .value_name("PATH")
+                        .help("listen on Unix socket PATH")
+                        .default_value("abrc.sock"),
+                )
+                .arg(
+                    Arg::with_name("threads")
+                        .short("j")
+                        .long("threads")
+                        .value_name("N")
+                        .help("number of resident engines (default: one per CPU)"),
+                ),
         );
     let matches = cli.get_matches();
 
@@ -75,9 +348,7 @@ fn main() {
         }
         ("filter", Some(filter)) => {
             let input_file = filter.value_of("filterset").unwrap();
-            let filterset_blob = std::fs::read(input_file).expect("unable to read filterset file");
-            let mut engine = Engine::new(false);
-            engine.deserialize(filterset_blob.as_ref()).expect("unable to deserialize filterset file");
+            let engine = load_engine(&map_filterset(input_file));
             
             let request_stream = serde_json::Deserializer::from_reader(std::io::stdin()).into_iter::<FilterRequest>();
             for result in request_stream {
@@ -93,6 +364,21 @@ fn main() {
                 
             }
         },
+        ("bulk", Some(bulk)) => {
+            let input_file = bulk.value_of("filterset").unwrap();
+            let filterset_blob = Arc::new(map_filterset(input_file));
+            if let Err(oops) = bulk_filter(filterset_blob, thread_count(bulk)) {
+                eprintln!("error in bulk filter: {0:?}", oops)
+            }
+        },
+        ("serve", Some(serve)) => {
+            let input_file = serve.value_of("filterset").unwrap();
+            let socket_path = serve.value_of("socket").unwrap();
+            let filterset_blob = Arc::new(map_filterset(input_file));
+            let _ = std::fs::remove_file(socket_path);
+            let listener = UnixListener::bind(socket_path).expect("unable to bind socket");
+            serve_forever(listener, filterset_blob, thread_count(serve));
+        },
         _ => eprintln!("{0}", matches.usage()),
     }
 }
@@ -0,0 +1,198 @@
+"""abrc_client: the shared clients for asking abrc whether requests match a filterset
+
+One long-lived `abrc filter` co-process (or an `abrc serve` socket) per process, with
+verdicts remembered in a VerdictCache so each (url, source_url, request_type) is only
+ever classified once per filterset.
+"""
+import atexit
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import struct
+import subprocess
+from collections import OrderedDict, defaultdict
+from typing import Callable, List, Sequence, Tuple, Union
+
+ABRC_EXE = os.environ.get("ABRC_EXE", os.path.join(os.path.dirname(__file__), "..", "abrc", "target", "release", "abrc"))
+ABRC_FSF = os.environ.get("ABRC_FSF", "filterset.dat")
+ABRC_BATCH = int(os.environ.get("ABRC_BATCH", 1000))
+ABRC_SOCKET = os.environ.get("ABRC_SOCKET")
+ABRC_CACHE = os.environ.get("ABRC_CACHE", "abrc_verdicts.sqlite")
+ABRC_LRU_SIZE = int(os.environ.get("ABRC_LRU_SIZE", 1 << 16))
+ABRC_HELLO_TIMEOUT = float(os.environ.get("ABRC_HELLO_TIMEOUT", 10.0))
+
+
+
+class AbrcFilter:
+    """long-lived `abrc filter` co-process: the filterset is deserialized once, then
+    requests stream through it (one JSON record in, one true/false line out)"""
+
+    def __init__(self, exe: str = ABRC_EXE, filterset: str = ABRC_FSF):
+        self.proc = subprocess.Popen([exe, "filter", "-f", filterset], stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding="utf8")
+
+    def check(self, requests: Sequence[Tuple[str, str, str]]) -> List[bool]:
+        """match each (url, source_url, request_type) against the filterset"""
+        results = []
+        # never have more than ABRC_BATCH answers in flight, so neither pipe can fill up and deadlock us
+        for i in range(0, len(requests), ABRC_BATCH):
+            batch = requests[i:i + ABRC_BATCH]
+            self.proc.stdin.write("".join(
+                json.dumps({"url": url, "source_url": source_url, "request_type": request_type}) + "\n"
+                for url, source_url, request_type in batch))
+            self.proc.stdin.flush()
+            for _ in batch:
+                line = self.proc.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"abrc exited unexpectedly (status {self.proc.poll()})")
+                results.append(json.loads(line))
+        return results
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+class AbrcSocketFilter:
+    """AbrcFilter look-alike talking to an already-running `abrc serve -s ABRC_SOCKET`
+    daemon, so nothing has to load the filterset at all
+
+    The daemon greets every connection with the digest of the filterset it loaded, which
+    is what its verdicts get cached under.
+    """
+
+    def __init__(self, path: str = ABRC_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+        self.sock.settimeout(ABRC_HELLO_TIMEOUT)
+        try:
+            (length,) = struct.unpack("<I", self.read_exactly(4))
+            self.digest = self.read_exactly(length).decode("ascii")
+        except socket.timeout:
+            raise RuntimeError(f"abrc serve at {path} did not report its filterset digest (is it an older abrc?)")
+        self.sock.settimeout(None)
+
+    def read_exactly(self, size: int) -> bytes:
+        data = self.rfile.read(size)
+        if len(data) != size:
+            raise RuntimeError("abrc serve closed the connection")
+        return data
+
+    def check(self, requests: Sequence[Tuple[str, str, str]]) -> List[bool]:
+        """match each (url, source_url, request_type) against the daemon's filterset"""
+        results = []
+        for i in range(0, len(requests), ABRC_BATCH):
+            batch = requests[i:i + ABRC_BATCH]
+            chunks = [struct.pack("<I", len(batch))]
+            for rid, fields in enumerate(batch):
+                chunks.append(struct.pack("<I", rid))
+                for field in fields:
+                    raw = field.encode("utf8")
+                    chunks.append(struct.pack("<I", len(raw)))
+                    chunks.append(raw)
+            self.sock.sendall(b"".join(chunks))
+            reply = self.read_exactly(5 * len(batch))
+            results.extend(bool(matched) for _, matched in struct.iter_unpack("<IB", reply))
+        return results
+
+    def alive(self) -> bool:
+        return True
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+_abrc_filter = None
+
+
+def get_abrc_filter() -> Union[AbrcFilter, AbrcSocketFilter]:
+    """this process's shared abrc client (each pool worker lazily starts its own)"""
+    global _abrc_filter
+    if _abrc_filter is None or not _abrc_filter.alive():
+        _abrc_filter = AbrcSocketFilter() if ABRC_SOCKET else AbrcFilter()
+        atexit.register(_abrc_filter.close)
+    return _abrc_filter
+
+
+def filterset_digest() -> str:
+    """SHA-1 of the filterset verdicts come from: the one the ABRC_SOCKET daemon reports
+    having loaded, else the local ABRC_FSF file"""
+    if ABRC_SOCKET:
+        return get_abrc_filter().digest
+    with open(ABRC_FSF, "rb") as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+class VerdictCache:
+    """remembers abrc verdicts per (url, source_url, request_type) and filterset digest,
+    in an in-memory LRU in front of an SQLite table shared by every process and run"""
+
+    def __init__(self, digest: str, db_file: str = ABRC_CACHE, lru_size: int = ABRC_LRU_SIZE):
+        self.digest = digest
+        self.lru = OrderedDict()
+        self.lru_size = lru_size
+        self.db = sqlite3.connect(db_file, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS verdicts (
+            digest TEXT, url TEXT, source_url TEXT, request_type TEXT, matched INTEGER,
+            PRIMARY KEY (digest, url, source_url, request_type)) WITHOUT ROWID""")
+
+    def remember(self, key: Tuple[str, str, str], matched: bool):
+        self.lru[key] = matched
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def check(self, requests: Sequence[Tuple[str, str, str]], classify: Callable[[Sequence[Tuple[str, str, str]]], List[bool]]) -> List[bool]:
+        """cached verdicts for `requests`, passing only the never-seen ones to `classify`"""
+        results = [None] * len(requests)
+        missing = defaultdict(list)
+        for i, key in enumerate(requests):
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                results[i] = self.lru[key]
+            else:
+                missing[key].append(i)
+
+        for key in list(missing):
+            row = self.db.execute(
+                "SELECT matched FROM verdicts WHERE digest = ? AND url = ? AND source_url = ? AND request_type = ?",
+                (self.digest, *key)).fetchone()
+            if row is not None:
+                for i in missing.pop(key):
+                    results[i] = bool(row[0])
+                self.remember(key, bool(row[0]))
+
+        if missing:
+            keys = list(missing)
+            verdicts = classify(keys)
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)",
+                    [(self.digest, *key, int(matched)) for key, matched in zip(keys, verdicts)])
+            for key, matched in zip(keys, verdicts):
+                for i in missing[key]:
+                    results[i] = matched
+                self.remember(key, matched)
+        return results
+
+
+_verdict_cache = None
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _verdict_cache
+    if _verdict_cache is None:
+        _verdict_cache = VerdictCache(filterset_digest())
+    return _verdict_cache
+
+
+def check_requests(requests: Sequence[Tuple[str, str, str]]) -> List[bool]:
+    """verdicts for (url, source_url, request_type) requests, via the verdict cache and this process's abrc client"""
+    return get_verdict_cache().check(requests, lambda keys: get_abrc_filter().check(keys))
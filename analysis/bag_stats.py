@@ -0,0 +1,81 @@
+"""bag_stats: the per-(stem, profile) stats pool and batched set/multiset Jaccard kernel
+shared by every analysis script
+"""
+import multiprocessing
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Optional, Sequence, Tuple
+
+import multiset
+import numpy as np
+
+from etld1 import merge_etld1s, take_new_etld1s
+from tree_index import walk_experiment_trees
+
+BagArrays = Tuple[np.ndarray, np.ndarray]
+
+
+def bag_arrays(bag: Iterable[Hashable], vocab: Dict[Hashable, int]) -> BagArrays:
+    """intern a set/multiset's members into `vocab`; returns its (sorted member IDs, counts)"""
+    pairs = list(bag.items()) if hasattr(bag, "items") else [(m, 1) for m in bag]
+    ids = np.fromiter((vocab.setdefault(m, len(vocab)) for m, _ in pairs), dtype=np.int64, count=len(pairs))
+    counts = np.fromiter((c for _, c in pairs), dtype=np.int64, count=len(pairs))
+    order = np.argsort(ids)
+    return ids[order], counts[order]
+
+
+def batch_jaccard(pairs: Sequence[Tuple[BagArrays, BagArrays]], as_multiset: bool = True) -> np.ndarray:
+    """common.jaccard_index() for many (bag_arrays(a), bag_arrays(b)) pairs at once
+
+    Gives the same scores as jaccard_index() on multisets (or on plain sets, with
+    `as_multiset=False`): each pair's members are keyed by (pair number, member ID) so a
+    single sorted intersection covers the whole batch.
+    """
+    P = len(pairs)
+    if not P:
+        return np.zeros(0)
+    width = 1 + max((int(ids[-1]) for pair in pairs for ids, _ in pair if len(ids)), default=0)
+
+    def stack(side: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        keys = np.concatenate([pair[side][0] + i * width for i, pair in enumerate(pairs)])
+        counts = np.concatenate([pair[side][1] for pair in pairs])
+        if not as_multiset:
+            counts = np.ones_like(counts)
+        return keys, counts, keys // width
+
+    keys_a, counts_a, owner_a = stack(0)
+    keys_b, counts_b, owner_b = stack(1)
+    common, ia, ib = np.intersect1d(keys_a, keys_b, assume_unique=True, return_indices=True)
+    num = np.bincount(common // width, weights=np.minimum(counts_a[ia], counts_b[ib]), minlength=P)
+    den = np.bincount(owner_a, weights=counts_a, minlength=P) + np.bincount(owner_b, weights=counts_b, minlength=P) - num
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _stat_task(task: Tuple[Callable[[Optional[str]], Any], str, int, Optional[str]]) -> Tuple[str, int, Any, Dict[str, Optional[str]]]:
+    extractor, stem, index, directory = task
+    thing = extractor(directory)
+    # the eTLD+1s this worker resolved go back with the result, to be saved by the parent
+    return stem, index, thing, take_new_etld1s()
+
+
+def parallel_stats(root_map: Mapping[str, str], extractor: Callable[[Optional[str]], multiset.Multiset]) -> Iterable[Tuple[str, Sequence[Any]]]:
+    """yield (stem, [extractor(dir) per profile]) for every stem, in completion order
+
+    Every (stem, profile) pair is its own task on a CPU-sized pool, so no stem waits on
+    another's slowest profile.
+    """
+    tasks = (
+        (extractor, stem, index, directory)
+        for stem, *dirs in walk_experiment_trees(root_map)
+        for index, directory in enumerate(dirs)
+    )
+    pending = {}
+    with multiprocessing.Pool() as pool:
+        for stem, index, thing, resolved in pool.imap_unordered(_stat_task, tasks, chunksize=1):
+            merge_etld1s(resolved)
+            things, remaining = pending.get(stem, ([None] * len(root_map), len(root_map)))
+            things[index] = thing
+            if remaining == 1:
+                del pending[stem]
+                yield (stem, things)
+            else:
+                pending[stem] = (things, remaining - 1)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""bench_jaccard: check batch_jaccard() against jaccard_index() and time both on synthetic per-profile bags
+
+Mimics parallel_ji_distros(): STEMS stems, each with PROFILES bags compared pairwise.
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+import multiset
+
+from bag_stats import bag_arrays, batch_jaccard
+from common import jaccard_index
+
+STEMS = int(os.environ.get("STEMS", 20))
+PROFILES = int(os.environ.get("PROFILES", 8))
+BAG_SIZE = int(os.environ.get("BAG_SIZE", 20000))
+UNIVERSE = int(os.environ.get("UNIVERSE", 5000))
+SEED = int(os.environ.get("SEED", 0))
+
+
+def random_bag(rng: random.Random) -> multiset.Multiset:
+    return multiset.Multiset(("HTML element", f"tag{rng.randrange(UNIVERSE)}") for _ in range(BAG_SIZE))
+
+
+def main(argv):
+    rng = random.Random(SEED)
+    stems = [[random_bag(rng) for _ in range(PROFILES)] for _ in range(STEMS)]
+    combos = list(itertools.combinations(range(PROFILES), 2))
+
+    t0 = time.perf_counter()
+    expected = [jaccard_index(bags[i], bags[j]) for bags in stems for i, j in combos]
+    t1 = time.perf_counter()
+    vocab = {}
+    arrays = [[bag_arrays(bag, vocab) for bag in bags] for bags in stems]
+    t2 = time.perf_counter()
+    actual = batch_jaccard([(a[i], a[j]) for a in arrays for i, j in combos]).tolist()
+    t3 = time.perf_counter()
+
+    set_expected = [jaccard_index(set(bags[i]), set(bags[j])) for bags in stems for i, j in combos]
+    set_actual = batch_jaccard([(a[i], a[j]) for a in arrays for i, j in combos], as_multiset=False).tolist()
+    assert actual == expected, "multiset scores differ!"
+    assert set_actual == set_expected, "set scores differ!"
+
+    print(f"{STEMS} stems x {len(combos)} pairs of {BAG_SIZE:,}-member bags ({UNIVERSE:,} distinct members); scores identical")
+    print(f"  multiset.Multiset jaccard_index: {t1 - t0:8.3f}s")
+    print(f"  bag_arrays (interning):          {t2 - t1:8.3f}s")
+    print(f"  batch_jaccard:                   {t3 - t2:8.3f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
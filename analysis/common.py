@@ -2,36 +2,18 @@
 """
 import glob
 import itertools
-import multiprocessing
 import os
 from collections import defaultdict
-from typing import Any, Callable, Iterable, Optional, Sequence, Tuple, Mapping
-from urllib.parse import urlparse
+from typing import Callable, Iterable, Optional, Mapping
 
 import multiset
 import networkx as nx
 import numpy as np
 import pandas as pd
-from publicsuffix2 import get_sld
 
-
-def url_etld1(url: str) -> str:
-    bits = urlparse(url)
-    return get_sld(bits.hostname)
-
-
-def walk_experiment_trees(root_map: Mapping[str, str]) -> Iterable[Sequence[str]]:
-    graphml_dirs = defaultdict(dict)
-    for tag, root in root_map.items():
-        for node, _, files in os.walk(root):
-            if any(f.endswith(".graphml") for f in files):
-                stem = os.path.relpath(node, root)
-                pre_stem = node[:-len(stem)]
-                graphml_dirs[stem][tag] = node
-    
-    tags = list(root_map.keys())
-    for stem, dir_map in graphml_dirs.items():
-        yield [stem] + [dir_map.get(t) for t in tags]
+from etld1 import etld1_series, hostname_etld1, url_etld1
+from tree_index import walk_experiment_trees
+from bag_stats import bag_arrays, batch_jaccard, parallel_stats
 
 
 def graphs_in_dir(directory: Optional[str]) -> Iterable[nx.MultiDiGraph]:
@@ -46,19 +28,15 @@ def jaccard_index(a: multiset.Multiset, b: multiset.Multiset) -> float:
     return num / den if den else np.nan
 
 
-def parallel_stats(root_map: Mapping[str, str], extractor: Callable[[Optional[str]], multiset.Multiset]) -> Iterable[Tuple[str, Sequence[Any]]]:
-    with multiprocessing.Pool(processes=len(root_map)) as pool:
-        for stem, *dirs in walk_experiment_trees(root_map):
-            things = pool.map(extractor, dirs, chunksize=1)
-            yield (stem, things)
-
-
 def parallel_ji_distros(root_map: Mapping[str, str], bagger: Callable[[Optional[str]], multiset.Multiset]) -> pd.DataFrame:
     scores = defaultdict(list)
     tags = list(root_map)
+    vocab = {}
     for _, bags in parallel_stats(root_map, bagger):
-        for (t1, bag1), (t2, bag2) in itertools.combinations(zip(tags, bags), 2):
-            ji = jaccard_index(bag1, bag2)
-            scores[(t1, t2)].append(ji)
+        arrays = [bag_arrays(bag, vocab) for bag in bags]
+        tag_pairs = list(itertools.combinations(range(len(tags)), 2))
+        jis = batch_jaccard([(arrays[i], arrays[j]) for i, j in tag_pairs])
+        for (i, j), ji in zip(tag_pairs, jis.tolist()):
+            scores[(tags[i], tags[j])].append(ji)
 
     return pd.DataFrame(scores)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""error_matrix: single-pass, parallel replacement for errors.sh (writes the error_rates.py input CSV)
+"""
+import csv
+import multiprocessing
+import os
+import re
+import sys
+from typing import Iterable, Tuple
+
+from loguru import logger
+
+# same patterns errors.sh greps for
+RE_ERROR = re.compile(rb"^ERROR ")
+RE_FATAL = re.compile(rb"FATAL:[^:][^:]*:")
+RE_PG_FATAL = re.compile(rb"\*PageGraph\* Assert failed: ")
+
+_RE_PROFILE_FIELDS = re.compile(r"^(\w+)(\d+)$")
+
+
+def find_crawl_logs(root: str) -> Tuple[str, list]:
+    logs = []
+    for node, _, files in os.walk(root):
+        if "crawl.log" in files:
+            logs.append(os.path.join(node, "crawl.log"))
+    return root, logs
+
+
+def scan_crawl_log(log_file: str) -> Tuple[bool, bool, bool]:
+    has_error = has_fatal = has_pg_fatal = False
+    try:
+        with open(log_file, "rb") as fd:
+            for line in fd:
+                has_error = has_error or bool(RE_ERROR.match(line))
+                has_fatal = has_fatal or bool(RE_FATAL.search(line))
+                has_pg_fatal = has_pg_fatal or bool(RE_PG_FATAL.search(line))
+                if has_error and has_fatal and has_pg_fatal:
+                    break
+    except OSError:
+        logger.exception(f"unable to scan '{log_file}' (counting it as clean)")
+    return has_error, has_fatal, has_pg_fatal
+
+
+def error_counts(flags: Iterable[Tuple[bool, bool, bool]]) -> Tuple[int, int, int, int, int]:
+    total = all_issues = non_fatal = fatal_non_pg = fatal_pg = 0
+    for has_error, has_fatal, has_pg_fatal in flags:
+        total += 1
+        all_issues += has_error or has_fatal
+        non_fatal += has_error and not has_fatal
+        fatal_non_pg += has_fatal and not has_pg_fatal
+        fatal_pg += has_pg_fatal
+    return total, all_issues, non_fatal, fatal_non_pg, fatal_pg
+
+
+def profile_fields(root: str) -> Tuple[str, str, str]:
+    root = os.path.normpath(root)
+    run = os.path.basename(os.path.dirname(os.path.abspath(root)))
+    m = _RE_PROFILE_FIELDS.match(os.path.basename(root))
+    if not m:
+        raise ValueError(root)
+    return run, m.group(1), m.group(2)
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(f"usage: {argv[0]} PROFILE_ROOT1 [PROFILE_ROOT2 [...]] >ERROR_MATRIX_CSV")
+        return
+    roots = argv[1:]
+    # check every root's name before walking any of them
+    try:
+        fields = {root: profile_fields(root) for root in roots}
+    except ValueError as err:
+        sys.exit(f"'{err}' is not a <policy><N> profile root")
+
+    with multiprocessing.Pool() as pool:
+        log_map = dict(pool.imap_unordered(find_crawl_logs, roots))
+        all_logs = [lf for r in roots for lf in log_map[r]]
+        flag_map = dict(zip(all_logs, pool.imap(scan_crawl_log, all_logs, chunksize=64)))
+
+    wtr = csv.writer(sys.stdout, lineterminator="\n")
+    wtr.writerow(['run', 'policy', 'instance', 'total_logs', 'total_errors', 'non_fatal', 'fatal_non_pg', 'fatal_pg'])
+    for root in roots:
+        wtr.writerow([*fields[root], *error_counts(flag_map[lf] for lf in log_map[root])])
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,86 @@
+"""etld1: the one hostname -> eTLD+1 resolver shared by every analysis script
+
+Resolutions are memoized in a bounded LRU and, with ETLD1_TABLE set, persisted in a
+(hostname, etld1) CSV that later runs (and processes) start from.
+"""
+import atexit
+import csv
+import functools
+import os
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+from publicsuffix2 import get_sld
+
+ETLD1_CACHE_SIZE = int(os.environ.get("ETLD1_CACHE_SIZE", 1 << 16))
+ETLD1_TABLE = os.environ.get("ETLD1_TABLE")
+
+_etld1_table = None
+_etld1_new = {}
+
+
+def _get_etld1_table() -> Dict[str, Optional[str]]:
+    """hostname -> eTLD+1 pairs persisted in the ETLD1_TABLE CSV (if any), loaded once"""
+    global _etld1_table
+    if _etld1_table is None:
+        _etld1_table = {}
+        if ETLD1_TABLE and os.path.exists(ETLD1_TABLE):
+            with open(ETLD1_TABLE, "rt", encoding="utf8", newline="") as fd:
+                _etld1_table.update((hostname, etld1 or None) for hostname, etld1 in csv.reader(fd))
+        if ETLD1_TABLE:
+            atexit.register(save_etld1_table)
+    return _etld1_table
+
+
+def save_etld1_table():
+    """append hostnames resolved since the table was loaded to ETLD1_TABLE"""
+    if ETLD1_TABLE and _etld1_new:
+        with open(ETLD1_TABLE, "at", encoding="utf8", newline="") as fd:
+            csv.writer(fd, lineterminator="\n").writerows((h, e or "") for h, e in _etld1_new.items())
+        _etld1_table.update(_etld1_new)
+        _etld1_new.clear()
+
+
+def take_new_etld1s() -> Dict[str, Optional[str]]:
+    """hostnames resolved here since the last call, for a pool worker to hand back to its
+    parent (workers exit without running atexit hooks, so they never save the table)"""
+    new = dict(_etld1_new)
+    if new:
+        _etld1_table.update(new)
+        _etld1_new.clear()
+    return new
+
+
+def merge_etld1s(resolved: Dict[str, Optional[str]]):
+    """queue a worker's take_new_etld1s() pairs to be saved with this process's table"""
+    if ETLD1_TABLE and resolved:
+        table = _get_etld1_table()
+        _etld1_new.update((h, e) for h, e in resolved.items() if h not in table)
+
+
+@functools.lru_cache(maxsize=ETLD1_CACHE_SIZE)
+def hostname_etld1(hostname: Optional[str]) -> Optional[str]:
+    if not hostname:
+        return None
+    table = _get_etld1_table()
+    if hostname in table:
+        return table[hostname]
+    etld1 = get_sld(hostname)
+    if ETLD1_TABLE:
+        _etld1_new[hostname] = etld1
+    return etld1
+
+
+def url_etld1(url: str) -> Optional[str]:
+    return hostname_etld1(urlparse(url).hostname)
+
+
+def etld1_series(values: pd.Series, hostnames: bool = False) -> pd.Series:
+    """url_etld1() (or hostname_etld1()) over a whole Series, resolving each distinct value once"""
+    codes, uniques = pd.factorize(values)
+    resolve = hostname_etld1 if hostnames else url_etld1
+    # code -1 (missing values) picks the trailing None
+    resolved = np.array([resolve(v) for v in uniques] + [None], dtype=object)
+    return pd.Series(resolved[codes], index=values.index, name=values.name)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""extract_bags: derive per-frame node/edge bags from PageGraph files (the sim/ stages' input)
+
+Writes OUT_DIR/<hostname>/<crawl_url_tag>/<md5(frame_url)>/url plus <profile>.nbag and
+<profile>.ebag, one member per line (repeated per occurrence, sorted), e.g.
+
+    Html[div]
+    CreateNode:Script[https://x.com/a.js]->Html[div]
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import sys
+from collections import Counter
+from typing import Iterable, Mapping, Optional, Tuple
+
+from loguru import logger
+
+from graphml_stream import stream_graphml
+from tree_index import walk_experiment_trees
+
+NODE_TYPE_NAMES = {
+    "remote frame": "RemoteFrame",
+    "resource": "Resource",
+    "web API": "WebAPI",
+    "JS builtin": "JsBuiltin",
+    "HTML element": "Html",
+    "text node": "Text",
+    "DOM root": "DomRoot",
+    "frame owner": "FrameOwner",
+    "local storage": "LocalStorage",
+    "session storage": "SessionStorage",
+    "cookie jar": "CookieJar",
+    "script": "Script",
+    "parser": "Parser",
+}
+
+# which node attribute (if any) goes in a member's [detail]
+NODE_DETAIL_ATTRS = {
+    "Html": "tag name",
+    "FrameOwner": "tag name",
+    "Resource": "url",
+    "Script": "url",
+    "WebAPI": "method",
+    "JsBuiltin": "method",
+}
+
+_RE_WORD = re.compile(r"[A-Za-z0-9]+")
+RE_FRAME_ID = re.compile(r"^page_graph_([0-9A-Fa-f]{32})\.(\d+)\.graphml$")
+
+
+def camel_case(type_name: str) -> str:
+    """PageGraph "edge type"/"node type" string -> compare_full_bagz member type ("js call" -> "JsCall")"""
+    return "".join(w[:1].upper() + w[1:] for w in _RE_WORD.findall(type_name))
+
+
+def node_label(attrs: Mapping[str, str]) -> str:
+    node_type = attrs.get("node type", "")
+    type_name = NODE_TYPE_NAMES.get(node_type) or camel_case(node_type)
+    detail = attrs.get(NODE_DETAIL_ATTRS.get(type_name, ""))
+    if detail:
+        return f"{type_name}[{' '.join(detail.split())}]"
+    return type_name
+
+
+def extract_graph_bags(filename: str) -> Tuple[Optional[str], Counter, Counter]:
+    """(frame url, node bag, edge bag) for one graph, in one streaming pass"""
+    frame_url = None
+    labels = {}
+    node_bag, edge_bag = Counter(), Counter()
+    items = stream_graphml(
+        filename,
+        node_attrs=("node type", *set(NODE_DETAIL_ATTRS.values())),
+        edge_attrs=("edge type",),
+        with_desc=True,
+    )
+    for kind, u, v, attrs in items:
+        if kind == "node":
+            labels[u] = label = node_label(attrs)
+            node_bag[label] += 1
+        elif kind == "edge":
+            edge_type = camel_case(attrs.get("edge type", ""))
+            edge_bag[f"{edge_type}:{labels.get(u, '?')}->{labels.get(v, '?')}"] += 1
+        else:
+            frame_url = attrs.get("url")
+    return frame_url, node_bag, edge_bag
+
+
+def write_atomically(filename: str, text: str):
+    tmp_name = f"{filename}.tmp{os.getpid()}"
+    with open(tmp_name, "wt", encoding="utf8") as fd:
+        fd.write(text)
+    os.replace(tmp_name, filename)
+
+
+def bag_text(bag: Counter) -> str:
+    return "".join(f"{member}\n" * count for member, count in sorted(bag.items()))
+
+
+def graph_version_key(name: str) -> Tuple[str, int]:
+    """(frame id, version) of a page_graph_<id>.<version>.graphml name; other names sort by name"""
+    m = RE_FRAME_ID.match(name)
+    return (m.group(1).lower(), int(m.group(2))) if m else (name, -1)
+
+
+def extract_dir(task: Tuple[str, str, str, str]) -> Tuple[int, int]:
+    """write the bags of every graph in one (profile, site_tag) directory; returns (frames written, graphs failed)"""
+    out_dir, profile, site_tag, directory = task
+    frames = {}
+    frame_ids = {}
+    failed = 0
+    # versions of one frame in increasing numeric order (10 after 2), so the highest one wins
+    for name in sorted((f for f in os.listdir(directory) if f.endswith(".graphml")), key=graph_version_key):
+        try:
+            frame_url, node_bag, edge_bag = extract_graph_bags(os.path.join(directory, name))
+        except Exception:
+            logger.exception(f"unable to extract bags from '{os.path.join(directory, name)}' (skipping)")
+            failed += 1
+            continue
+        if frame_url:
+            frame_id = graph_version_key(name)[0]
+            if frame_ids.setdefault(frame_url, frame_id) != frame_id:
+                logger.warning(f"frames {frame_ids[frame_url]} and {frame_id} in '{directory}' share URL '{frame_url}' ({frame_id} wins)")
+                frame_ids[frame_url] = frame_id
+            frames[frame_url] = (node_bag, edge_bag)
+
+    for frame_url, (node_bag, edge_bag) in frames.items():
+        frame_dir = os.path.join(out_dir, site_tag, hashlib.md5(frame_url.encode("utf8")).hexdigest())
+        os.makedirs(frame_dir, exist_ok=True)
+        write_atomically(os.path.join(frame_dir, "url"), frame_url + "\n")
+        write_atomically(os.path.join(frame_dir, f"{profile}.nbag"), bag_text(node_bag))
+        write_atomically(os.path.join(frame_dir, f"{profile}.ebag"), bag_text(edge_bag))
+    return len(frames), failed
+
+
+def extraction_tasks(out_dir: str, root_map: Mapping[str, str]) -> Iterable[Tuple[str, str, str, str]]:
+    profiles = list(root_map)
+    for stem, *dirs in walk_experiment_trees(root_map):
+        for profile, directory in zip(profiles, dirs):
+            if directory is not None:
+                yield out_dir, profile, stem, directory
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(f"usage: {argv[0]} OUT_DIR PROFILE_ROOT1 [PROFILE_ROOT2 [...]]")
+        return
+    out_dir = argv[1]
+    root_map = {os.path.basename(os.path.normpath(r)): r for r in argv[2:]}
+
+    total_frames = total_failed = 0
+    with multiprocessing.Pool() as pool:
+        for frames, failed in pool.imap_unordered(extract_dir, extraction_tasks(out_dir, root_map), chunksize=1):
+            total_frames += frames
+            total_failed += failed
+    print(f"{total_frames:,} frame bags written, {total_failed:,} graphs failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
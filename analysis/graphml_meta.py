@@ -0,0 +1,26 @@
+"""graphml_meta: the one PageGraph <desc> header reader shared by every analysis script
+"""
+from collections import namedtuple
+from xml.etree import ElementTree
+
+PageGraphMetadata = namedtuple('PageGraphMetadata', ['version', 'url', 'is_root', 'timespan'])
+
+GRAPHML_HEADER_CHUNK = 4096
+
+
+def get_graphml_meta(graphml_file: str) -> PageGraphMetadata:
+    """parse just the <desc> header, reading only as far as </desc> (safe to call from threads)"""
+    ns = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+    parser = ElementTree.XMLPullParser(events=("end",))
+    with open(graphml_file, "rb") as fd:
+        for chunk in iter(lambda: fd.read(GRAPHML_HEADER_CHUNK), b""):
+            parser.feed(chunk)
+            for _, desc in parser.read_events():
+                if desc.tag == "{http://graphml.graphdrawing.org/xmlns}desc":
+                    start, end = desc.findtext('g:time/g:start', namespaces=ns), desc.findtext('g:time/g:end', namespaces=ns)
+                    return PageGraphMetadata(
+                        desc.findtext('g:version', namespaces=ns),
+                        desc.findtext('g:url', namespaces=ns),
+                        desc.findtext('g:is_root', namespaces=ns) == "true",
+                        (float(start), float(end)) if start and end else None)
+    raise ValueError(f"no <desc> header in '{graphml_file}'")
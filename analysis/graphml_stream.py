@@ -0,0 +1,57 @@
+"""graphml_stream: the streaming GraphML reader shared by every analysis script
+"""
+from typing import Any, BinaryIO, Collection, Iterable, Mapping, Optional, Tuple, Union
+from xml.etree import ElementTree
+
+GRAPHML_NS = "{http://graphml.graphdrawing.org/xmlns}"
+_GRAPHML_TYPES = {"int": int, "long": int, "float": float, "double": float, "boolean": lambda v: v == "true"}
+
+GraphMLItem = Tuple[str, str, Optional[str], Mapping[str, Any]]
+
+
+def stream_graphml(
+    source: Union[str, BinaryIO],
+    node_attrs: Collection[str] = (),
+    edge_attrs: Collection[str] = (),
+    with_desc: bool = False,
+) -> Iterable[GraphMLItem]:
+    """iterparse a GraphML file without building a graph, yielding ("node", id, None, attrs)
+    and ("edge", source, target, attrs) items carrying only the requested attributes
+
+    Elements are discarded as soon as they are yielded, so memory stays bounded no matter
+    how large the graph is.  (PageGraph writes all nodes before any edges.)  With `with_desc`,
+    the PageGraph <desc> header comes first as ("desc", None, None, {"url": ..., "time/start": ...}).
+    """
+    keys = {}
+    graph = None
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == GRAPHML_NS + "graph":
+                graph = elem
+            continue
+        if tag == GRAPHML_NS + "desc" and with_desc:
+            fields = {}
+            for child in elem:
+                name = child.tag[len(GRAPHML_NS):]
+                for leaf in (child if len(child) else [child]):
+                    key = name if leaf is child else f"{name}/{leaf.tag[len(GRAPHML_NS):]}"
+                    fields[key] = (leaf.text or "").strip()
+            yield ("desc", None, None, fields)
+        elif tag == GRAPHML_NS + "key":
+            keys[elem.get("id")] = (elem.get("for"), elem.get("attr.name"), _GRAPHML_TYPES.get(elem.get("attr.type"), str))
+        elif tag == GRAPHML_NS + "node" or tag == GRAPHML_NS + "edge":
+            kind = tag[len(GRAPHML_NS):]
+            wanted = node_attrs if kind == "node" else edge_attrs
+            attrs = {}
+            for data in elem:
+                _, name, cast = keys.get(data.get("key"), (None, None, str))
+                if name in wanted and data.text is not None:
+                    attrs[name] = cast(data.text)
+            if kind == "node":
+                yield (kind, elem.get("id"), None, attrs)
+            else:
+                yield (kind, elem.get("source"), elem.get("target"), attrs)
+            elem.clear()
+            if graph is not None:
+                graph.remove(elem)
@@ -1,16 +1,16 @@
 """common: utilties for extracting stats from parallel crawls
 """
 import glob
+import hashlib
 import itertools
 import json
-import multiprocessing
 import os
 import re
-import subprocess
-from collections import defaultdict, namedtuple
-from typing import (Any, Callable, Iterable, Mapping, Optional, Sequence,
-                    Tuple, Union)
-from xml.etree import ElementTree
+import sqlite3
+import sys
+from collections import Counter, defaultdict, namedtuple
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, List, Mapping,
+                    Optional, Sequence, Tuple, Union)
 
 import multiset
 import networkx as nx
@@ -18,36 +18,14 @@ import numpy as np
 import pandas as pd
 from loguru import logger
 
-PageGraphMetadata = namedtuple('PageGraphMetadata', ['version', 'url', 'is_root', 'timespan'])
-
-
-def get_graphml_meta(graphml_file: str) -> PageGraphMetadata:
-    ns = {'g': 'http://graphml.graphdrawing.org/xmlns'}
-    etree = ElementTree.parse(graphml_file)
-    root = etree.getroot()
-    desc = root.find('g:desc', ns)
-    is_root_text = desc.find('g:is_root', ns).text
-    time_start_text = desc.find('g:time/g:start', ns).text
-    time_end_text = desc.find('g:time/g:end', ns).text
-    return PageGraphMetadata(
-        desc.find('g:version', ns).text,
-        desc.find('g:url', ns).text, 
-        is_root_text == "true",
-        (float(time_start_text), float(time_end_text)))
-
-
-def walk_experiment_trees(root_map: Mapping[str, str]) -> Iterable[Sequence[str]]:
-    graphml_dirs = defaultdict(dict)
-    for tag, root in root_map.items():
-        for node, _, files in os.walk(root):
-            if any(f.endswith(".graphml") for f in files):
-                stem = os.path.relpath(node, root)
-                pre_stem = node[:-len(stem)]
-                graphml_dirs[stem][tag] = node
-    
-    tags = list(root_map.keys())
-    for stem, dir_map in graphml_dirs.items():
-        yield [stem] + [dir_map.get(t) for t in tags]
+# the shared analysis/ modules live one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from etld1 import etld1_series, hostname_etld1, url_etld1
+from tree_index import walk_experiment_trees
+from bag_stats import bag_arrays, batch_jaccard, parallel_stats
+from abrc_client import check_requests
+from graphml_meta import PageGraphMetadata, get_graphml_meta
+from graphml_stream import stream_graphml
 
 
 def graphs_in_dir(directory: Optional[str], with_filename: bool = False) -> Iterable[Union[nx.MultiDiGraph, Tuple[nx.MultiDiGraph, str]]]:
@@ -59,8 +37,158 @@ def graphs_in_dir(directory: Optional[str], with_filename: bool = False) -> Iter
                 yield nx.read_graphml(fn)
 
 
-ABRC_EXE = os.environ.get("ABRC_EXE", os.path.join(os.path.dirname(__file__), "..", "abrc", "target", "release", "abrc"))
-ABRC_FSF = os.environ.get("ABRC_FSF", "filterset.dat")
+FEATURE_CACHE = os.environ.get("FEATURE_CACHE")  # e.g. graph_features.sqlite; unset re-parses the XML every time
+
+FeatureRecord = Dict[str, Any]
+
+
+class HashingReader:
+    """file wrapper that hashes the bytes iterparse pulls through it"""
+
+    def __init__(self, fd: BinaryIO):
+        self.fd = fd
+        self.hash = hashlib.sha1()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.fd.read(size)
+        self.hash.update(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        for chunk in iter(lambda: self.read(1 << 16), b""):
+            pass
+        return self.hash.hexdigest()
+
+
+def extract_features(filename: str) -> Tuple[str, FeatureRecord]:
+    """(content digest, feature record) for one PageGraph file, in a single streaming pass
+
+    The record holds the <desc> metadata, [node type, count] and [HTML tag, count] rows,
+    [url, request type, count] rows for every edge into a resource node, and
+    [source, level, location url, count] rows for console.log calls.
+    """
+    meta = {}
+    node_types, html_tags = Counter(), Counter()
+    requests, console = Counter(), Counter()
+    resource_urls = {}
+    console_log = None
+    with open(filename, "rb") as fd:
+        reader = HashingReader(fd)
+        items = stream_graphml(
+            reader,
+            node_attrs=("node type", "tag name", "method", "url"),
+            edge_attrs=("request type", "args"),
+            with_desc=True,
+        )
+        for kind, u, v, attrs in items:
+            if kind == "node":
+                node_type = attrs.get("node type")
+                node_types[node_type] += 1
+                if node_type == "HTML element":
+                    html_tags[attrs.get("tag name")] += 1
+                elif node_type == "resource":
+                    resource_urls[u] = attrs.get("url")
+                elif console_log is None and node_type == "web API" and attrs.get("method") == "console.log":
+                    console_log = u
+            elif kind == "edge":
+                if v in resource_urls:
+                    requests[(resource_urls[v], attrs.get("request type"))] += 1
+                elif v == console_log and attrs.get("args"):
+                    jargs = json.loads(attrs["args"])
+                    console[(jargs.get("source"), jargs.get("level"), jargs.get("location", {}).get("url"))] += 1
+            else:
+                meta = {
+                    "version": attrs.get("version"),
+                    "url": attrs.get("url"),
+                    "is_root": attrs.get("is_root") == "true",
+                    "timespan": [float(attrs["time/start"]), float(attrs["time/end"])] if "time/start" in attrs else None,
+                }
+        digest = reader.hexdigest()
+
+    return digest, {
+        "meta": meta,
+        "node_types": [[key, count] for key, count in node_types.items()],
+        "html_tags": [[key, count] for key, count in html_tags.items()],
+        "requests": [[*key, count] for key, count in requests.items()],
+        "console": [[*key, count] for key, count in console.items()],
+    }
+
+
+class FeatureCache:
+    """per-graph feature records keyed by the SHA-1 of the graph file's bytes (identical graphs
+    copied between trees share one record), plus a (path, size, mtime) table so unchanged
+    files are not re-hashed; safe to share between processes"""
+
+    def __init__(self, db_file: str):
+        self.db = sqlite3.connect(db_file, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT);
+            CREATE TABLE IF NOT EXISTS features (digest TEXT PRIMARY KEY, record TEXT);
+        """)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def digest_for(self, filename: str) -> Optional[str]:
+        """cached digest for `filename`, or None if it is unknown or has changed since"""
+        st = os.stat(filename)
+        row = self.db.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (os.path.abspath(filename),)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def lookup(self, filename: str) -> Optional[FeatureRecord]:
+        digest = self.digest_for(filename)
+        if digest is None:
+            return None
+        row = self.db.execute("SELECT record FROM features WHERE digest = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store(self, filename: str, size: int, mtime_ns: int, digest: str, record: FeatureRecord):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (os.path.abspath(filename), size, mtime_ns, digest))
+        self.db.execute("INSERT OR IGNORE INTO features VALUES (?, ?)", (digest, json.dumps(record, separators=(",", ":"))))
+
+    def get_features(self, filename: str) -> FeatureRecord:
+        """cached feature record for `filename`, extracting (and caching) it on a miss"""
+        record = self.lookup(filename)
+        if record is None:
+            st = os.stat(filename)
+            digest, record = extract_features(filename)
+            with self.db:
+                self.store(filename, st.st_size, st.st_mtime_ns, digest, record)
+        return record
+
+
+_feature_cache = None
+
+
+def get_feature_cache() -> Optional[FeatureCache]:
+    """this process's FEATURE_CACHE connection (None if no cache is configured)"""
+    global _feature_cache
+    if _feature_cache is None and FEATURE_CACHE:
+        _feature_cache = FeatureCache(FEATURE_CACHE)
+    return _feature_cache
+
+
+def get_graph_features(filename: str) -> FeatureRecord:
+    """feature record for one graph: from FEATURE_CACHE if configured, else freshly extracted"""
+    cache = get_feature_cache()
+    if cache is not None:
+        return cache.get_features(filename)
+    return extract_features(filename)[1]
+
+
+def get_graph_meta(graphml_file: str) -> PageGraphMetadata:
+    """get_graphml_meta(), answered from FEATURE_CACHE when one is configured"""
+    if get_feature_cache() is None:
+        return get_graphml_meta(graphml_file)
+    meta = get_graph_features(graphml_file)["meta"]
+    if not meta:
+        raise ValueError(f"no <desc> header in '{graphml_file}'")
+    return PageGraphMetadata(meta["version"], meta["url"], meta["is_root"], tuple(meta["timespan"]) if meta["timespan"] else None)
+
 
 RE_FRAME_ID = re.compile(r"^page_graph_([0-9A-Fa-f]{32})\.(\d+)\.graphml$")
 
@@ -70,32 +198,25 @@ FrameRoot = namedtuple('FrameRoot', ['graph', 'frame_url', 'site_url'])
 def filter_frame_loaders(frame_roots: Sequence[FrameRoot]) -> Sequence[bool]:
     if not frame_roots:
         return []
-    
-    json_input = "\n".join(json.dumps({"url": f.frame_url, "source_url": f.site_url, "request_type": "sub_frame"}) for f in frame_roots)
-    proc = subprocess.run([ABRC_EXE, "filter", "-f", ABRC_FSF], input=json_input, capture_output=True, check=True, encoding="utf8")
-    return list(map(json.loads, proc.stdout.split()))
+    requests = [(f.frame_url, f.site_url, "sub_frame") for f in frame_roots]
+    return check_requests(requests)
 
 
-RE_URL_TAG = re.compile(rb"<url>([^<>]+)</url>")
+def find_3p_nonad_graphs(directory: Optional[str]) -> list:
+    return [nx.read_graphml(fn) for fn in find_3p_nonad_graph_files(directory)]
 
 
-def find_3p_nonad_graphs(directory: Optional[str]) -> list:
+def find_3p_nonad_graph_files(directory: Optional[str]) -> list:
     """this is kind of hacky/broken right now, but so is our data and I'm tired of dealing with it"""
-    from xml.sax.saxutils import unescape
     sub_frames = []
     if directory:
         origin_host = os.path.basename(os.path.dirname(directory))
         origin_url = f"https://{origin_host}/"
         
-        for graph, filename in graphs_in_dir(directory, with_filename=True):
-            with open(filename, "rb") as fd:
-                blob = fd.read()
-                is_root = b"<is_root>true</is_root>" in blob
-                raw_url = RE_URL_TAG.search(blob).group(1)
-                root_url = unescape(raw_url.decode('utf8'))
-            #meta = get_graphml_meta(filename)
-            if not is_root: #meta.is_root:
-                sub_frames.append(FrameRoot(graph, root_url, origin_url)) #meta.url, origin_url))
+        for filename in glob.glob(os.path.join(directory, "*.graphml")):
+            meta = get_graph_meta(filename)
+            if not meta.is_root:
+                sub_frames.append(FrameRoot(filename, meta.url, origin_url))
     
     frame_ad_matches = filter_frame_loaders(sub_frames)
     return [sf.graph for sf, ad in zip(sub_frames, frame_ad_matches) if not ad]
@@ -138,20 +259,16 @@ def jaccard_index(a: multiset.Multiset, b: multiset.Multiset) -> float:
     return num / den if den else np.nan
 
 
-def parallel_stats(root_map: Mapping[str, str], extractor: Callable[[Optional[str]], multiset.Multiset]) -> Iterable[Tuple[str, Sequence[Any]]]:
-    with multiprocessing.Pool(processes=len(root_map)) as pool:
-        for stem, *dirs in walk_experiment_trees(root_map):
-            things = pool.map(extractor, dirs, chunksize=1)
-            yield (stem, things)
-
-
 def parallel_ji_distros(root_map: Mapping[str, str], bagger: Callable[[Optional[str]], multiset.Multiset]) -> pd.DataFrame:
     scores = defaultdict(list)
     tags = list(root_map)
+    tag_pairs = list(itertools.combinations(range(len(tags)), 2))
+    vocab = {}
     for _, bags in parallel_stats(root_map, bagger):
-        for (t1, bag1), (t2, bag2) in itertools.combinations(zip(tags, bags), 2):
-            ji = jaccard_index(bag1, bag2)
-            scores[f"{t1}/{t2}"].append(ji)
+        arrays = [bag_arrays(bag, vocab) for bag in bags]
+        jis = batch_jaccard([(arrays[i], arrays[j]) for i, j in tag_pairs])
+        for (i, j), ji in zip(tag_pairs, jis.tolist()):
+            scores[f"{tags[i]}/{tags[j]}"].append(ji)
 
     return pd.DataFrame(scores)
 
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import glob
 import itertools
-import json
 import os
 import sys
 from collections import namedtuple, Counter
@@ -10,15 +9,14 @@ from urllib.parse import urlparse
 
 import matplotlib.pyplot as plt
 import multiset
-import networkx as nx
 import numpy as np
 import pandas as pd
 from loguru import logger
-from publicsuffix2 import get_sld
 
 from common import (
+    get_graph_features,
     get_profile_groups,
-    graphs_in_dir,
+    hostname_etld1,
     parallel_stats,
     rank_distinguished_items,
 )
@@ -32,34 +30,25 @@ ConsoleTuple = namedtuple("ConsoleTuple", ["kind", "level", "etld1", "path"])
 
 def get_console_bag_for_dir(directory: Optional[str]) -> multiset.Multiset:
     bag = multiset.Multiset()
-    for graph in graphs_in_dir(directory):
+    graph_files = glob.glob(os.path.join(directory, "*.graphml")) if directory is not None else []
+    for filename in graph_files:
         try:
-            node_types = nx.get_node_attributes(graph, "node type")
-            console_node_candidates = [
-                k
-                for k, v in node_types.items()
-                if v == "web API" and graph.nodes[k].get("method") == "console.log"
-            ]
-            if console_node_candidates:
-                cln = console_node_candidates[0]
-                for u, v, eid, args in graph.in_edges(cln, data="args", keys=True):
-                    if args:
-                        jargs = json.loads(args)
-                        url = jargs.get("location", {}).get("url")
-                        if url:
-                            bits = urlparse(url)
-                            hostname = bits.hostname
-                            upath = bits.path
-                        else:
-                            hostname = upath = None
-                        bag.add(
-                            ConsoleTuple(
-                                jargs.get("source"),
-                                jargs.get("level"),
-                                get_sld(hostname) if hostname else None,
-                                upath,
-                            )
-                        )
+            for source, level, url, count in get_graph_features(filename)["console"]:
+                if url:
+                    bits = urlparse(url)
+                    hostname = bits.hostname
+                    upath = bits.path
+                else:
+                    hostname = upath = None
+                bag.add(
+                    ConsoleTuple(
+                        source,
+                        level,
+                        hostname_etld1(hostname),
+                        upath,
+                    ),
+                    count,
+                )
         except:
             logger.exception(f"error processing graph in {directory} (skipping)")
     return bag
@@ -3,25 +3,22 @@ import glob
 import itertools
 import os
 import sys
-from collections import Counter, deque, defaultdict
+from collections import deque, defaultdict
 from typing import Iterable, Sequence, Optional
 
 import multiset
-import networkx as nx
 import numpy as np
 import pandas as pd
 
-from common import parallel_ji_distros, find_3p_nonad_graphs
+from common import parallel_ji_distros, find_3p_nonad_graph_files, get_graph_features
 
 BASENAME = os.environ.get('BASENAME', 'node_bag_ji_distros')
 
 
 def get_node_bag_for_dir(dirname: Optional[str]) -> multiset.Multiset:
     bag_map = multiset.Multiset()
-    for graph in find_3p_nonad_graphs(dirname):
-        node_types = nx.get_node_attributes(graph, "node type")
-        html_nodes = [graph.nodes[k].get("tag name") for k, v in node_types.items() if v == "HTML element"]
-        bag_map.update(Counter(html_nodes))
+    for filename in find_3p_nonad_graph_files(dirname):
+        bag_map.update(dict(get_graph_features(filename)["html_tags"]))
     return bag_map
 
 
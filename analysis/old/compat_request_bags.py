@@ -2,28 +2,21 @@
 import glob
 import os
 import sys
-from urllib.parse import urlparse
 from typing import Optional
 
 import multiset
-import networkx as nx
 import pandas as pd
-from publicsuffix2 import get_sld
 
-from common import parallel_ji_distros, find_3p_nonad_graphs
+from common import parallel_ji_distros, find_3p_nonad_graph_files, get_graph_features, url_etld1
 
 BASENAME = os.environ.get('BASENAME', 'request_bag_ji_distros')
 
 
 def get_request_bag_for_dir(dirname: Optional[str]) -> multiset.Multiset:
     bag_map = multiset.Multiset()
-    for graph in find_3p_nonad_graphs(dirname):
-        resource_nodes = [k for k, v in nx.get_node_attributes(graph, "node type").items() if v == "resource"]
-        for k, v in nx.get_node_attributes(graph, "node type").items():
-            if v == 'resource':
-                url_fields = urlparse(graph.nodes[k]["url"])
-                etld1 = get_sld(url_fields.hostname)
-                bag_map.update((etld1, rt) for n1, n2, eid, rt in graph.in_edges(k, data="request type", keys=True))
+    for filename in find_3p_nonad_graph_files(dirname):
+        for url, request_type, count in get_graph_features(filename)["requests"]:
+            bag_map.add((url_etld1(url), request_type), count)
     return bag_map
 
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""features: read every .graphml once and fill the FEATURE_CACHE the compat_* baggers read from
+
+With FEATURE_CACHE set, get_graph_features()/get_graph_meta() (and so the node, request
+and console baggers and find_3p_nonad_graph_files) answer from the cache; this script
+just warms it up front, in parallel.
+"""
+import multiprocessing
+import os
+import sys
+from typing import Iterable, Optional, Tuple
+
+from loguru import logger
+
+from common import FEATURE_CACHE, FeatureCache, FeatureRecord, extract_features
+
+
+def extract_file(filename: str) -> Tuple[bool, str, int, int, Optional[str], Optional[FeatureRecord]]:
+    st = os.stat(filename)
+    try:
+        digest, record = extract_features(filename)
+        return True, filename, st.st_size, st.st_mtime_ns, digest, record
+    except Exception:
+        logger.exception(f"unable to extract features from '{filename}' (skipping)")
+        return False, filename, st.st_size, st.st_mtime_ns, None, None
+
+
+def find_graph_files(roots: Iterable[str]) -> Iterable[str]:
+    for root in roots:
+        for node, _, files in os.walk(root):
+            for f in files:
+                if f.endswith(".graphml"):
+                    yield os.path.join(node, f)
+
+
+def main(argv):
+    if len(argv) < 2 or not FEATURE_CACHE:
+        print(f"usage: FEATURE_CACHE=DB_FILE {argv[0]} ROOT1 [ROOT2 [...]]")
+        return
+
+    cache = FeatureCache(FEATURE_CACHE)
+    todo = [fn for fn in find_graph_files(argv[1:]) if cache.digest_for(fn) is None]
+    extracted = failed = 0
+    with multiprocessing.Pool() as pool:
+        for ok, filename, size, mtime_ns, digest, record in pool.imap_unordered(extract_file, todo, chunksize=8):
+            if ok:
+                cache.store(filename, size, mtime_ns, digest, record)
+                extracted += 1
+            else:
+                failed += 1
+    cache.close()
+    print(f"{extracted:,} graphs extracted, {failed:,} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,9 +1,25 @@
 #!/usr/bin/env python3
+import os
 import sys
+from collections import Counter
+from typing import Iterable
 
 import pandas as pd
 
-from common import url_etld1
+from common import etld1_series
+
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", 1 << 20))
+
+
+def read_3p_nonad_frames(bagz_csv_file: str) -> Iterable[pd.DataFrame]:
+    """(frame_url, site_tag) rows for 3p non-ad frames, a chunk at a time"""
+    chunks = pd.read_csv(
+        bagz_csv_file,
+        usecols=['site_tag', 'frame_url', 'is_root', 'is_ad'],
+        dtype={'site_tag': 'category', 'frame_url': 'category'},
+        chunksize=CSV_CHUNK_ROWS)
+    for chunk in chunks:
+        yield chunk.loc[(chunk.is_root == False) & (chunk.is_ad == False), ['frame_url', 'site_tag']]
 
 
 def main(argv):
@@ -15,11 +31,19 @@ def main(argv):
         print(f"usage: {argv[0]} BAGZ_CSV MASTER_URLS_CSV PRIVACY_FLOWS_CSV")
         return
     
-    bagz_df = pd.read_csv(bagz_csv_file)
-    bagz_df = bagz_df.loc[(bagz_df.is_root == False) & (bagz_df.is_ad == False)]
+    # one pass over the bagz: stream out the frame/site map, keeping only the distinct (frame, site) pairs
+    url_df = pd.read_csv(master_url_file, index_col="site_tag")
+    frame_sites = set()
+    with open("frame_site_map.csv", "wt", encoding="utf8") as fd:
+        for i, frames_df in enumerate(read_3p_nonad_frames(bagz_csv_file)):
+            frame_map = frames_df.join(url_df, on="site_tag")
+            frame_map[['frame_url', 'crawl_url']].to_csv(fd, header=(i == 0), index=False)
+            pairs_df = frames_df.dropna().drop_duplicates()
+            frame_sites.update(zip(pairs_df.frame_url, pairs_df.site_tag))
 
-    popular_frame_urls_df = bagz_df.groupby('frame_url').site_tag.nunique().sort_values(ascending=False).reset_index()
-    popular_frame_urls_df["frame_etld1"] = popular_frame_urls_df.frame_url.map(url_etld1)
+    site_counts = pd.Series(Counter(frame_url for frame_url, _ in frame_sites), name='site_tag', dtype='int64')
+    popular_frame_urls_df = site_counts.rename_axis('frame_url').sort_index().sort_values(ascending=False).reset_index()
+    popular_frame_urls_df["frame_etld1"] = etld1_series(popular_frame_urls_df.frame_url)
     popular_frame_urls_df = popular_frame_urls_df.set_index('frame_etld1')
 
     priv_df = pd.read_csv(privacy_file)
@@ -32,10 +56,6 @@ def main(argv):
     wut = popular_frame_urls_df.join(domain_tokens, on="frame_etld1")
     wut.to_csv("popular_frame_urls.csv")
 
-    url_df = pd.read_csv(master_url_file, index_col="site_tag")
-    frame_map = bagz_df.join(url_df, on="site_tag")
-    frame_map[['frame_url', 'crawl_url']].to_csv("frame_site_map.csv", index=False)
-
 
 
     #popular_frame_urls_df.to_csv("popularity_frame_urls.csv")
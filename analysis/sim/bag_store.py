@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""bag_store: one-time ingest of .nbag/.ebag text files into a compact, indexed NumPy store
+
+Members are interned as integer IDs (with precomputed type codes) and each bag is kept
+as a sorted run of (member ID, count) pairs, so later comparisons never touch the text.
+"""
+import glob
+import multiprocessing
+import os
+import re
+import sys
+from collections import Counter
+from typing import Iterable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+RE_NODE_PATTERN = re.compile(r"^(\w+)(?:\[|$)")
+RE_EDGE_PATTERN = re.compile(r"^(\w+):")
+
+ALL_NODE_TYPES = [
+    "RemoteFrame",
+    "Resource",
+    "WebAPI",
+    "JsBuiltin",
+    "Html",
+    "Text",
+    "DomRoot",
+    "FrameOwner",
+    "LocalStorage",
+    "SessionStorage",
+    "CookieJar",
+    "Script",
+    "Parser",
+]
+
+ALL_EDGE_TYPES = [
+    "TextChange",
+    "CreateNode",
+    "InsertNode",
+    "RemoveNode",
+    "DeleteNode",
+    "JsCall",
+    "Execute",
+    "RequestStart",
+    "RequestError",
+    "RequestComplete",
+    "AddEventListener",
+    "RemoveEventListener",
+    "EventListener",
+    "StorageSet",
+    "ReadStorageCall",
+    "DeleteStorage",
+    "ClearStorage",
+    "ExecuteFromAttribute",
+    "SetAttribute",
+    "DeleteAttribute",
+]
+
+BAG_KINDS = {".nbag": (0, RE_NODE_PATTERN), ".ebag": (1, RE_EDGE_PATTERN)}
+
+
+def read_bag(file_name: str) -> Counter:
+    _, regex = BAG_KINDS[os.path.splitext(file_name)[1]]
+    bag = Counter()
+    with open(file_name, "rt", encoding="utf8") as fd:
+        for line in fd:
+            line = line.strip()
+            if not regex.match(line):
+                raise ValueError(f"unexpected set member type ({line})")
+            bag[line] += 1
+    return bag
+
+
+def read_frame(url_file: str) -> Tuple[str, str, List[Tuple[str, int, Counter]]]:
+    *_, hostname, crawl_url_tag, _, _ = url_file.split(os.sep)
+    site_tag = os.path.join(hostname, crawl_url_tag)
+    with open(url_file, "rt", encoding="utf8") as fd:
+        frame_url = fd.read().strip()
+
+    work_dir = os.path.dirname(url_file)
+    bags = []
+    for bf in sorted(glob.glob(os.path.join(work_dir, "*.nbag")) + glob.glob(os.path.join(work_dir, "*.ebag"))):
+        profile, ext = os.path.splitext(os.path.basename(bf))
+        bags.append((profile, BAG_KINDS[ext][0], read_bag(bf)))
+    return site_tag, frame_url, bags
+
+
+class BagStore:
+    def __init__(self, arrays: Mapping[str, np.ndarray]):
+        self.members = arrays["members"]
+        self.member_types = arrays["member_types"]
+        self.type_names = arrays["type_names"]
+        self.profile_names = arrays["profile_names"]
+        self.frame_site_tags = arrays["frame_site_tags"]
+        self.frame_urls = arrays["frame_urls"]
+        self.bag_frame = arrays["bag_frame"]
+        self.bag_profile = arrays["bag_profile"]
+        self.bag_kind = arrays["bag_kind"]
+        self.bag_offsets = arrays["bag_offsets"]
+        self.bag_ids = arrays["bag_ids"]
+        self.bag_counts = arrays["bag_counts"]
+
+    @classmethod
+    def load(cls, file_name: str) -> "BagStore":
+        with np.load(file_name) as arrays:
+            return cls(dict(arrays.items()))
+
+    @classmethod
+    def ingest(cls, frames: Iterable[Tuple[str, str, List[Tuple[str, int, Counter]]]]) -> "BagStore":
+        member_index = {}
+        type_index = {}
+        member_types = []
+        profile_index = {}
+        frame_site_tags, frame_urls = [], []
+        bag_frame, bag_profile, bag_kind, bag_offsets = [], [], [], [0]
+        bag_ids, bag_counts = [], []
+        for site_tag, frame_url, bags in frames:
+            frame = len(frame_urls)
+            frame_site_tags.append(site_tag)
+            frame_urls.append(frame_url)
+            for profile, kind, bag in bags:
+                pairs = []
+                for member, count in bag.items():
+                    mid = member_index.get(member)
+                    if mid is None:
+                        mid = member_index[member] = len(member_index)
+                        regex = RE_EDGE_PATTERN if kind else RE_NODE_PATTERN
+                        type_name = regex.match(member).group(1)
+                        member_types.append(type_index.setdefault(type_name, len(type_index)))
+                    pairs.append((mid, count))
+                pairs.sort()
+                bag_ids.extend(mid for mid, _ in pairs)
+                bag_counts.extend(count for _, count in pairs)
+                bag_frame.append(frame)
+                bag_profile.append(profile_index.setdefault(profile, len(profile_index)))
+                bag_kind.append(kind)
+                bag_offsets.append(len(bag_ids))
+
+        return cls({
+            "members": np.array(list(member_index), dtype=str),
+            "member_types": np.array(member_types, dtype=np.int16),
+            "type_names": np.array(list(type_index), dtype=str),
+            "profile_names": np.array(list(profile_index), dtype=str),
+            "frame_site_tags": np.array(frame_site_tags, dtype=str),
+            "frame_urls": np.array(frame_urls, dtype=str),
+            "bag_frame": np.array(bag_frame, dtype=np.int32),
+            "bag_profile": np.array(bag_profile, dtype=np.int16),
+            "bag_kind": np.array(bag_kind, dtype=np.int8),
+            "bag_offsets": np.array(bag_offsets, dtype=np.int64),
+            "bag_ids": np.array(bag_ids, dtype=np.int32),
+            "bag_counts": np.array(bag_counts, dtype=np.int32),
+        })
+
+    def save(self, file_name: str):
+        np.savez_compressed(file_name, **{k: v for k, v in vars(self).items()})
+
+    def bag(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(sorted member IDs, counts) for bag number `index`"""
+        lo, hi = self.bag_offsets[index], self.bag_offsets[index + 1]
+        return self.bag_ids[lo:hi], self.bag_counts[lo:hi]
+
+    def frame_bags(self, kind: int) -> Iterable[Tuple[int, Sequence[Tuple[str, int]]]]:
+        """yield (frame, [(profile name, bag index), ...] sorted by profile) for all bags of `kind`"""
+        # bags are ingested frame-by-frame, so each frame's bags are contiguous
+        current, bags = None, []
+        for i in np.flatnonzero(self.bag_kind == kind):
+            frame = int(self.bag_frame[i])
+            if frame != current and bags:
+                yield current, sorted(bags)
+                bags = []
+            current = frame
+            bags.append((str(self.profile_names[self.bag_profile[i]]), int(i)))
+        if bags:
+            yield current, sorted(bags)
+
+
+def main(argv):
+    try:
+        store_file = argv[1]
+        url_files = argv[2:]
+        if not url_files:
+            raise IndexError()
+    except IndexError:
+        print(f"usage: {argv[0]} STORE_FILE.npz URL_FILE1 [URL_FILE2 [...]]")
+        return
+
+    with multiprocessing.Pool() as pool:
+        store = BagStore.ingest(pool.imap(read_frame, url_files, chunksize=16))
+    store.save(store_file)
+    print(f"{len(store.frame_urls):,} frames, {len(store.bag_frame):,} bags, {len(store.members):,} distinct members", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
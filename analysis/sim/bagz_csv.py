@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""bagz_csv: chunked, typed aggregation for bagz/all-graphs CSVs too big to load whole
+
+Rows are read CSV_CHUNK_ROWS at a time with categorical key columns; each chunk is
+reduced to per-group partial sums right away, so peak memory follows the number of
+groups rather than the number of rows.
+"""
+import os
+from typing import Iterable, Mapping, Optional, Sequence, Tuple
+
+import pandas as pd
+
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", 1 << 20))
+
+BAGZ_DTYPES = {
+    "site_tag": "category",
+    "frame_url": "category",
+    "p1": "category",
+    "p2": "category",
+    "profile_tag": "category",
+    "node_jaccard": "float64",
+    "edge_jaccard": "float64",
+}
+
+PAIR_KEYS = ['site_tag', 'frame_url', 'p2', 'p1']
+
+
+def read_chunks(
+    filename: str,
+    usecols: Optional[Sequence[str]] = None,
+    dtype: Mapping[str, str] = BAGZ_DTYPES,
+) -> Iterable[pd.DataFrame]:
+    return pd.read_csv(filename, usecols=usecols, dtype=dtype, chunksize=CSV_CHUNK_ROWS)
+
+
+def plain_index(index: pd.Index) -> pd.Index:
+    """rebuild an index from plain (non-categorical) values, so its levels sort by value again"""
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays([plain_index(index.get_level_values(i)) for i in range(index.nlevels)], names=index.names)
+    if isinstance(index, pd.CategoricalIndex):
+        return index.astype(index.categories.dtype)
+    return index
+
+
+def grouped_sums(chunks: Iterable[pd.DataFrame], keys: Sequence[str], fields: Sequence[str]) -> pd.DataFrame:
+    """chunk-at-a-time equivalent of pd.concat(chunks).groupby(keys)[fields].sum()"""
+    total = None
+    for chunk in chunks:
+        partial = chunk.groupby(keys, observed=True, sort=False)[list(fields)].sum()
+        total = partial if total is None else total.add(partial, fill_value=0)
+    if total is None:
+        return pd.DataFrame(columns=list(fields))
+    total.index = plain_index(total.index)
+    return total.sort_index()
+
+
+def mask_is_contiguous(filename: str, mask_column: str) -> bool:
+    """whether every mask's rows sit in one unbroken run (reads only the mask column)"""
+    seen, current = set(), None
+    for chunk in read_chunks(filename, usecols=[mask_column]):
+        for mask in chunk[mask_column].to_numpy():
+            if mask != current:
+                if mask in seen:
+                    return False
+                seen.add(mask)
+                current = mask
+    return True
+
+
+def mask_groups(
+    filename: str,
+    mask_column: str,
+    keys: Sequence[str],
+    fields: Sequence[str],
+) -> Iterable[Tuple[int, pd.DataFrame]]:
+    """yield (mask, that mask's rows of [mask_column, *keys, *fields]) one mask at a time
+
+    Mask-major input (each mask's rows contiguous, as compare_full_bagz.py writes its
+    edge_mask sweep) is streamed holding only one mask's rows; anything else falls back
+    to grouped_sums() over [mask_column, *keys], i.e. one pre-summed row per key.
+    """
+    usecols = [mask_column, *keys, *fields]
+    if not mask_is_contiguous(filename, mask_column):
+        sums = grouped_sums(read_chunks(filename, usecols=usecols), [mask_column, *keys], fields)
+        for mask, part in sums.groupby(level=mask_column, sort=False):
+            yield mask, part.reset_index()
+        return
+
+    current, parts = None, []
+    for chunk in read_chunks(filename, usecols=usecols):
+        for mask, part in chunk.groupby(mask_column, sort=False):
+            if mask != current:
+                if parts:
+                    yield current, pd.concat(parts)
+                current, parts = mask, []
+            parts.append(part)
+    if parts:
+        yield current, pd.concat(parts)
@@ -4,10 +4,10 @@ import os
 import sys
 from collections import defaultdict
 
-import pandas as pd
 from scipy import stats
 
-from compare_full_bagz import ALL_NODE_TYPES
+from bag_store import ALL_NODE_TYPES
+from bagz_csv import PAIR_KEYS, mask_groups
 
 
 def node_set(mask: int) -> tuple:
@@ -16,19 +16,19 @@ def node_set(mask: int) -> tuple:
 
 def main(argv):
     try:
-        big_df = pd.read_csv(argv[1])
+        csv_file = argv[1]
         field = argv[2]
     except IndexError:
         print(f"usage: {argv[0]} BRUTE_BAGS.CSV FIELD_NAME")
         return
-    csv_stem = os.path.splitext(argv[1])[0]
-
-    ndf = big_df.groupby(['node_mask', 'site_tag', 'frame_url', 'p2', 'p1'])[field].sum().unstack().dropna().reset_index()
-    
-    cm1_map = [
-        (gdf.transpose().apply(lambda r: (r.vanilla1 - r.fullblock3p1, r.vanilla1 - r.fullblock3p2)).transpose().mean(axis=1).sum(), node_set(mask))
-        for mask, gdf in ndf.groupby('node_mask')
-    ]
+    csv_stem = os.path.splitext(csv_file)[0]
+
+    # one mask's rows at a time, never the whole file
+    cm1_map = []
+    for mask, mdf in mask_groups(csv_file, 'node_mask', PAIR_KEYS, [field]):
+        gdf = mdf.groupby(PAIR_KEYS, observed=True)[field].sum().unstack().dropna().reset_index()
+        score = gdf.transpose().apply(lambda r: (r.vanilla1 - r.fullblock3p1, r.vanilla1 - r.fullblock3p2)).transpose().mean(axis=1).sum()
+        cm1_map.append((score, node_set(mask)))
     cm1_map.sort(reverse=True)
     
     cluster_dump_file = f"{csv_stem}_{field}_set_scores.csv"
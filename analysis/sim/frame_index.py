@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""frame_index: persistent (profile, site_tag, frame_url) -> graph file index, with is_root/is_ad flags
+
+Built once (headers sniffed in parallel, ad flags through the shared abrc client and
+verdict cache), then every lookup is a single indexed SQLite query.  The index records
+the root it was built from and each site directory's mtime, so refresh() only re-reads
+directories that a recrawl has changed (and rebuilds outright for a different root).
+"""
+import multiprocessing
+import os
+import sqlite3
+import sys
+from collections import namedtuple
+from typing import List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+# the shared analysis/ modules live one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from abrc_client import check_requests
+from graphml_meta import get_graphml_meta
+
+FRAME_INDEX = os.environ.get("FRAME_INDEX", "frame_index.sqlite")
+
+FrameGraph = namedtuple('FrameGraph', ['profile', 'site_tag', 'frame_url', 'graph_file', 'is_root', 'is_ad'])
+
+SiteDir = Tuple[str, str, str, int]  # (profile, site_tag, path, mtime_ns)
+
+
+def find_site_dirs(profile_dir: str) -> List[SiteDir]:
+    """(profile, site_tag, path, mtime) for every directory under ROOT_DIR/PROFILE/"""
+    profile = os.path.basename(profile_dir)
+    found = []
+    for node, _, _ in os.walk(profile_dir):
+        try:
+            found.append((profile, os.path.relpath(node, profile_dir), node, os.stat(node).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+    return found
+
+
+def list_site_graphs(site_dir: SiteDir) -> List[Tuple[str, str, str]]:
+    """(profile, site_tag, graph file) for every .graphml directly in one site directory"""
+    profile, site_tag, path, _ = site_dir
+    try:
+        return [(profile, site_tag, e.path) for e in os.scandir(path) if e.name.endswith(".graphml")]
+    except FileNotFoundError:
+        return []
+
+
+def index_graph(entry: Tuple[str, str, str]) -> Tuple[str, str, Optional[str], str, bool]:
+    profile, site_tag, graph_file = entry
+    try:
+        meta = get_graphml_meta(graph_file)
+    except (ElementTree.ParseError, ValueError):
+        return profile, site_tag, None, graph_file, False
+    return profile, site_tag, meta.url, graph_file, meta.is_root
+
+
+def filter_frame_loaders(requests: Sequence[Tuple[str, str]]) -> List[bool]:
+    """ad verdicts for (frame url, site url) sub_frame requests"""
+    if not requests:
+        return []
+    return check_requests([(url, site_url, "sub_frame") for url, site_url in requests])
+
+
+class FrameIndex:
+    def __init__(self, db_file: str = FRAME_INDEX):
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS frames (
+                profile TEXT, site_tag TEXT, frame_url TEXT, graph_file TEXT, is_root INTEGER, is_ad INTEGER);
+            CREATE INDEX IF NOT EXISTS frames_lookup ON frames (profile, site_tag, frame_url);
+            CREATE TABLE IF NOT EXISTS site_dirs (profile TEXT, site_tag TEXT, mtime_ns INTEGER, PRIMARY KEY (profile, site_tag));
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    @property
+    def root(self) -> Optional[str]:
+        """the ROOT_DIR this index was built from"""
+        row = self.db.execute("SELECT value FROM settings WHERE name = 'root'").fetchone()
+        return row[0] if row else None
+
+    def build(self, root_dir: str):
+        """(re)index every graph under ROOT_DIR/PROFILE/SITE_TAG/"""
+        root_dir = os.path.abspath(root_dir)
+        with self.db:
+            self.db.execute("DELETE FROM frames")
+            self.db.execute("DELETE FROM site_dirs")
+            self.db.execute("INSERT OR REPLACE INTO settings VALUES ('root', ?)", (root_dir,))
+        self.refresh(root_dir)
+
+    def refresh(self, root_dir: str):
+        """bring the index up to date with ROOT_DIR, re-reading only site directories whose
+        mtime moved (a crawl's dir is recreated on every attempt); a different root rebuilds"""
+        root_dir = os.path.abspath(root_dir)
+        if self.root != root_dir:
+            self.build(root_dir)
+            return
+
+        known = {(p, t): m for p, t, m in self.db.execute("SELECT profile, site_tag, mtime_ns FROM site_dirs")}
+        profile_dirs = [e.path for e in os.scandir(root_dir) if e.is_dir()]
+        with multiprocessing.Pool() as pool:
+            site_dirs = [d for found in pool.imap_unordered(find_site_dirs, profile_dirs) for d in found]
+            stale = [d for d in site_dirs if known.get(d[:2]) != d[3]]
+            entries = [e for found in pool.imap_unordered(list_site_graphs, stale, chunksize=64) for e in found]
+            rows = [r for r in pool.imap_unordered(index_graph, entries, chunksize=64) if r[2] is not None]
+
+        # sub-frames are ad-checked against their site's origin, as in find_3p_nonad_graph_files()
+        sub_frames = [r for r in rows if not r[4]]
+        ad_flags = filter_frame_loaders([(r[2], f"https://{r[1].split(os.sep)[0]}/") for r in sub_frames])
+        is_ad = {r[3]: ad for r, ad in zip(sub_frames, ad_flags)}
+
+        current = {d[:2] for d in site_dirs}
+        dropped = [d[:2] for d in stale] + [k for k in known if k not in current]
+        with self.db:
+            self.db.executemany("DELETE FROM frames WHERE profile = ? AND site_tag = ?", dropped)
+            self.db.executemany("DELETE FROM site_dirs WHERE profile = ? AND site_tag = ?", dropped)
+            self.db.executemany(
+                "INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?)",
+                [(*r, int(is_ad.get(r[3], False))) for r in rows])
+            self.db.executemany("INSERT INTO site_dirs VALUES (?, ?, ?)", [(p, t, m) for p, t, _, m in stale])
+
+    def lookup(self, profile: str, site_tag: str, frame_url: str) -> List[FrameGraph]:
+        rows = self.db.execute(
+            "SELECT * FROM frames WHERE profile = ? AND site_tag = ? AND frame_url = ? ORDER BY graph_file",
+            (profile, site_tag, frame_url))
+        return [FrameGraph(*r[:4], bool(r[4]), bool(r[5])) for r in rows]
+
+    def site_frames(self, profile: str, site_tag: str) -> List[FrameGraph]:
+        rows = self.db.execute(
+            "SELECT * FROM frames WHERE profile = ? AND site_tag = ? ORDER BY graph_file", (profile, site_tag))
+        return [FrameGraph(*r[:4], bool(r[4]), bool(r[5])) for r in rows]
+
+
+def main(argv):
+    try:
+        root_dir = argv[1]
+    except IndexError:
+        print(f"usage: {argv[0]} ROOT_DIR")
+        return
+
+    index = FrameIndex()
+    index.refresh(root_dir)
+    total, ads = index.db.execute("SELECT COUNT(*), SUM(is_ad) FROM frames").fetchone()
+    print(f"{total:,} graphs indexed ({ads or 0:,} ad frames) in {FRAME_INDEX}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
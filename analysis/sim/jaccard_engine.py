@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""jaccard_engine: brute-force edge-type-subset Jaccard sweeps without re-reading any bags
+
+Set/multiset intersections and unions decompose over member types (every member has
+exactly one type), so we compute per-type intersection and union sizes once for each
+compared bag pair; any mask's Jaccard score is then just a masked sum of those columns.
+"""
+import os
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from bag_store import BagStore
+
+# bytes of float64 scratch a mask chunk may use (its masks x pairs numerator, denominator and score arrays)
+SWEEP_MEMORY = int(os.environ.get("SWEEP_MEMORY", 256 << 20))
+
+
+def type_overlaps(
+    store: BagStore,
+    kind: int,
+    type_names: Sequence[str],
+    multiset: bool = False,
+) -> Tuple[List[Tuple[str, str, str, str]], np.ndarray, np.ndarray]:
+    """per-type intersection/union sizes for every (p1, p2) bag pair compare_full_bagz compares
+
+    Returns (pair rows of (site_tag, frame_url, p1, p2), intersections, unions), the
+    latter two being (pairs x types) arrays; member types not in `type_names` are dropped.
+    """
+    T = len(type_names)
+    lut = np.array([type_names.index(t) if t in type_names else T for t in store.type_names], dtype=np.int64)
+    member_cols = lut[store.member_types] if len(store.member_types) else np.zeros(0, dtype=np.int64)
+
+    def tally(ids: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        return np.bincount(member_cols[ids], weights=counts, minlength=T + 1)[:T]
+
+    rows, inters, unions = [], [], []
+    for frame, bags in store.frame_bags(kind):
+        site_tag, frame_url = str(store.frame_site_tags[frame]), str(store.frame_urls[frame])
+        p2, b2 = bags[-1]
+        ids2, counts2 = store.bag(b2)
+        if not multiset:
+            counts2 = np.ones_like(counts2)
+        total2 = tally(ids2, counts2)
+        for p1, b1 in bags[:-1]:
+            ids1, counts1 = store.bag(b1)
+            if not multiset:
+                counts1 = np.ones_like(counts1)
+            common, i1, i2 = np.intersect1d(ids1, ids2, assume_unique=True, return_indices=True)
+            inter = tally(common, np.minimum(counts1[i1], counts2[i2]))
+            rows.append((site_tag, frame_url, p1, p2))
+            inters.append(inter)
+            unions.append(tally(ids1, counts1) + total2 - inter)
+
+    shape = (len(rows), T)
+    return rows, np.array(inters).reshape(shape), np.array(unions).reshape(shape)
+
+
+def mask_bits(lo: int, hi: int, width: int) -> np.ndarray:
+    """(hi - lo) x width 0/1 matrix of masks lo..hi-1, most significant bit first (itertools.product order)"""
+    shifts = np.arange(width - 1, -1, -1)
+    return (np.arange(lo, hi)[:, None] >> shifts) & 1
+
+
+def mask_chunk(pairs: int) -> int:
+    """masks per sweep chunk, sized so the chunk's three (masks x pairs) arrays fit in SWEEP_MEMORY"""
+    return max(1, SWEEP_MEMORY // (3 * np.dtype(np.float64).itemsize * max(pairs, 1)))
+
+
+def sweep_masks(inters: np.ndarray, unions: np.ndarray) -> Iterable[Tuple[str, np.ndarray]]:
+    """yield (mask string, Jaccard score per pair) for every subset of the type columns"""
+    width = inters.shape[1]
+    chunk = mask_chunk(inters.shape[0])
+    for lo in range(0, 1 << width, chunk):
+        hi = min(lo + chunk, 1 << width)
+        bits = mask_bits(lo, hi, width).astype(inters.dtype)
+        nums = bits @ inters.T
+        dens = bits @ unions.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(dens > 0, nums / dens, np.nan)
+        for mask, row in zip(range(lo, hi), scores):
+            yield format(mask, f"0{width}b"), row
@@ -5,9 +5,10 @@ import re
 from collections import Counter
 
 import numpy as np
-import pandas as pd
 from matplotlib import pyplot as plt
 
+from bagz_csv import PAIR_KEYS, grouped_sums, read_chunks
+
 
 def save_ax_pdf(ax, filename: str, no_xticks: bool = True):
     fig = ax.get_figure()
@@ -28,12 +29,12 @@ def main(argv):
         return
     
     csv_stem = os.path.splitext(csvfile)[0]
-    df = pd.read_csv(csvfile)
+    sums = grouped_sums(read_chunks(csvfile, usecols=[*PAIR_KEYS, 'node_jaccard', 'edge_jaccard']), PAIR_KEYS, ['node_jaccard', 'edge_jaccard'])
 
     YRANGE = (-0.1, 1.1)
 
-    by_node = df.groupby(['site_tag', 'frame_url', 'p2', 'p1']).node_jaccard.sum().unstack().dropna()
-    by_edge = df.groupby(['site_tag', 'frame_url', 'p2', 'p1']).edge_jaccard.sum().unstack().dropna()
+    by_node = sums.node_jaccard.unstack().dropna()
+    by_edge = sums.edge_jaccard.unstack().dropna()
 
     T1 = 0.95
     T2 = 0.10
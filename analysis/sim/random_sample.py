@@ -1,14 +1,10 @@
 #!/usr/bin/env python3
 import csv
-import glob
-import os
-import re
 import sys
-from xml.sax.saxutils import unescape
 
 import pandas as pd
 
-RE_EXTRACT_META_TAGS = re.compile(r"<url>(.*?)</url>\s*<is_root>(true|false)</is_root>")
+from frame_index import FRAME_INDEX, FrameIndex
 
 
 def main(argv):
@@ -31,18 +27,16 @@ def main(argv):
 
     selected = bdf.groupby(['site_tag', 'frame_url', 'p2', 'p1']).node_jaccard.sum().unstack().dropna().sample(n=100)
 
+    # re-reads only what changed since the last run (or rebuilds, if it indexed another root)
+    index = FrameIndex()
+    print(f"refreshing frame index {FRAME_INDEX} for {root_dir}...", file=sys.stderr)
+    index.refresh(root_dir)
+
     wtr = csv.writer(sys.stdout, lineterminator="\n")
     wtr.writerow(['status', 'site_tag', 'frame_url', 'profile', 'graphml_file'])
     for (site_tag, frame_url) in selected.reset_index()[['site_tag', 'frame_url']].values:
         for p in PROFILES:
-            tdir = os.path.join(root_dir, p, site_tag)
-            matching_graph_files = []
-            for gf in glob.glob(os.path.join(tdir, "*.graphml")):
-                with open(gf, "rt", encoding="utf8") as fd:
-                    contents = fd.read()
-                m = RE_EXTRACT_META_TAGS.search(contents)
-                if m and unescape(m.group(1)) == frame_url:
-                    matching_graph_files.append(gf)
+            matching_graph_files = [fg.graph_file for fg in index.lookup(p, site_tag, frame_url)]
             if len(matching_graph_files) == 1:
                 status = 'ok'
             elif len(matching_graph_files) > 1:
@@ -8,6 +8,8 @@ import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
 
+from bagz_csv import grouped_sums, read_chunks
+
 
 RE_KEYVAL = re.compile(r"(\w+=)([^;&]+)([;&]|$)")
 
@@ -25,7 +27,6 @@ def main(argv):
         print(f"usage: {argv[0]} ALL_GRAPHS_CSV [URL_LIST_CSV]")
         return
 
-    all_graphs_df = pd.read_csv(csv_filename)
     csv_stem = os.path.splitext(csv_filename)[0]
     
     # optional per-site-tag error data used to filter out rows from URLs that encountered errors
@@ -33,23 +34,34 @@ def main(argv):
         url_df = pd.read_csv(argv[2])
         err_df = url_df.set_index('site_tag').drop(['order', 'crawl_url'], axis=1).transpose().any().transpose()
         err_df = err_df[err_df == False]
-        all_graphs_df = all_graphs_df[all_graphs_df.site_tag.isin(err_df.index)]
     else:
-        url_df = None
-    
-    # keep only 3p-no-ad frames
-    work_df = all_graphs_df[(all_graphs_df.is_root == False) & (all_graphs_df.is_ad == False)].drop(['is_root', 'is_ad'], axis=1)
-    
-    # strip out suspected-parameter-values from frame URLs to allow cross-profile matching of "same-frame" URLs for the same crawl-URL
-    simified_urls = work_df.url.apply(simify_url)
-    work_df.url = simified_urls
+        url_df = err_df = None
+
+    # the numeric features are the int64 columns (going by the first rows)
+    head_df = pd.read_csv(csv_filename, nrows=1000)
+    stats_fields = list(head_df.drop(['is_root', 'is_ad'], axis=1).dtypes[lambda d: d == np.int64].index.values)
+
+    def work_chunks():
+        for chunk in read_chunks(csv_filename):
+            if err_df is not None:
+                chunk = chunk[chunk.site_tag.isin(err_df.index)]
+
+            # keep only 3p-no-ad frames
+            work_df = chunk[(chunk.is_root == False) & (chunk.is_ad == False)].drop(['is_root', 'is_ad'], axis=1)
+
+            # strip out suspected-parameter-values from frame URLs to allow cross-profile matching of "same-frame" URLs for the same crawl-URL
+            # (each distinct URL is simified once)
+            work_df = work_df.assign(url=work_df.url.map({u: simify_url(u) for u in work_df.url.unique()}))
+            yield work_df
+
+    # per-(site, frame URL, profile) totals of every feature, accumulated chunk by chunk
+    sums = grouped_sums(work_chunks(), ['site_tag', 'url', 'profile_tag'], stats_fields)
 
     # plot curves for each numeric feature in the matrix
-    stats_fields = work_df.dtypes[work_df.dtypes == np.int64].index.values
     for field in stats_fields:
         # find crawled-URL/frame-URL field values that are equi-present (not equivalent!) across all profiles for that crawl
         # (i.e., count only frame-URLs that were loaded on all the profiles of a given crawl URL/site visit)
-        matched_df = work_df.groupby(['site_tag', 'url', 'profile_tag'])[field].sum().unstack().dropna().reset_index()
+        matched_df = sums[field].unstack().dropna().reset_index()
 
         # from those rows, compute the per-frame-URL median for this field metric
         print(field, matched_df.median())
@@ -0,0 +1,108 @@
+"""tree_index: walk_experiment_trees() and the persistent crawl-tree index behind it, shared by every analysis script
+"""
+import itertools
+import os
+import sqlite3
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Mapping, Optional, Sequence, Tuple
+
+TREE_INDEX = os.environ.get("TREE_INDEX")  # e.g. tree_index.sqlite; unset walks the trees with os.walk
+TREE_INDEX_THREADS = int(os.environ.get("TREE_INDEX_THREADS", 32))
+
+GraphFile = namedtuple('GraphFile', ['name', 'size', 'mtime_ns'])
+
+
+def _scan_dir(path: str, known_mtime_ns: Optional[int]) -> Tuple[str, Optional[int], Optional[list], Optional[list]]:
+    """(path, mtime, subdirs, graph files) for one directory; subdirs/graph files are None
+    if its mtime still matches the index (and mtime is None if it has vanished)"""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if mtime_ns == known_mtime_ns:
+            return path, mtime_ns, None, None
+        subdirs, graphs = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(".graphml"):
+                    st = entry.stat()
+                    graphs.append(GraphFile(entry.name, st.st_size, st.st_mtime_ns))
+        return path, mtime_ns, subdirs, graphs
+    except FileNotFoundError:
+        return path, None, None, None
+
+
+class TreeIndex:
+    """persistent (directory -> .graphml files) index of crawl trees
+
+    A directory's mtime changes whenever entries are added to or removed from it, so
+    refresh() only re-lists directories whose mtime moved; the rest cost one stat each.
+    """
+
+    def __init__(self, db_file: str):
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE TABLE IF NOT EXISTS graphs (dir TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, PRIMARY KEY (dir, name));
+        """)
+
+    @staticmethod
+    def _subtree(root: str) -> Tuple[str, str, str]:
+        # (root, lower, upper) bounds matching `root` and every path below it
+        return root, root + os.sep, root + chr(ord(os.sep) + 1)
+
+    def refresh(self, root: str):
+        root = os.path.abspath(root)
+        known = dict(self.db.execute(
+            "SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", self._subtree(root)))
+        seen = set()
+        frontier = [(root, None)]
+        with ThreadPoolExecutor(TREE_INDEX_THREADS) as pool, self.db:
+            while frontier:
+                parents = dict(frontier)
+                paths = list(parents)
+                next_frontier = []
+                for path, mtime_ns, subdirs, graphs in pool.map(_scan_dir, paths, [known.get(p) for p in paths]):
+                    if mtime_ns is None:
+                        continue
+                    seen.add(path)
+                    if subdirs is None:
+                        subdirs = [p for (p,) in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+                    else:
+                        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (path, parents[path], mtime_ns))
+                        self.db.execute("DELETE FROM graphs WHERE dir = ?", (path,))
+                        self.db.executemany("INSERT INTO graphs VALUES (?, ?, ?, ?)", [(path, *g) for g in graphs])
+                    next_frontier.extend((p, path) for p in subdirs)
+                frontier = next_frontier
+
+            gone = [(p,) for p in known if p not in seen]
+            self.db.executemany("DELETE FROM dirs WHERE path = ?", gone)
+            self.db.executemany("DELETE FROM graphs WHERE dir = ?", gone)
+
+    def graph_dirs(self, root: str) -> Iterable[Tuple[str, Sequence[GraphFile]]]:
+        """(directory, [GraphFile, ...]) for every directory under `root` holding .graphml files"""
+        rows = self.db.execute(
+            "SELECT dir, name, size, mtime_ns FROM graphs WHERE dir = ? OR (dir >= ? AND dir < ?) ORDER BY dir",
+            self._subtree(os.path.abspath(root)))
+        for directory, group in itertools.groupby(rows, key=lambda row: row[0]):
+            yield directory, [GraphFile(*row[1:]) for row in group]
+
+
+def walk_experiment_trees(root_map: Mapping[str, str]) -> Iterable[Sequence[str]]:
+    graphml_dirs = defaultdict(dict)
+    index = TreeIndex(TREE_INDEX) if TREE_INDEX else None
+    for tag, root in root_map.items():
+        if index is not None:
+            index.refresh(root)
+            nodes = (node for node, _ in index.graph_dirs(root))
+        else:
+            nodes = (node for node, _, files in os.walk(root) if any(f.endswith(".graphml") for f in files))
+        for node in nodes:
+            stem = os.path.relpath(node, root)
+            graphml_dirs[stem][tag] = os.path.normpath(os.path.join(root, stem))
+
+    tags = list(root_map.keys())
+    for stem, dir_map in graphml_dirs.items():
+        yield [stem] + [dir_map.get(t) for t in tags]
@@ -6,7 +6,10 @@ from functools import reduce
 
 import pandas as pd
 from matplotlib import pyplot as plt
-from publicsuffix2 import get_sld
+
+# the shared analysis/ modules live one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from etld1 import etld1_series
 
 
 def graph_counts_by_profile(df: pd.DataFrame) -> pd.DataFrame:
@@ -33,7 +36,9 @@ def main(argv):
         url_df = None
     
     # augment with eTLD+1 extracted from site-tag (i.e., from the crawl URL hostname)
-    orig_df['site_etld1'] = orig_df['site_tag'].apply(lambda x: get_sld(x.split('/')[0]))
+    # (resolving each distinct hostname once, not once per row)
+    site_hostnames = orig_df['site_tag'].str.split('/').str[0]
+    orig_df['site_etld1'] = etld1_series(site_hostnames, hostnames=True)
 
     # all graphs
     adf = orig_df.drop(['is_root', 'is_ad'], axis=1)
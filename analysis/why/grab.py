@@ -2,31 +2,37 @@
 import csv
 import glob
 import os
-import re
 import shutil
 import sys
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from urllib.parse import urlparse
 
 from loguru import logger
-from publicsuffix2 import get_sld
 
-RE_EXTRACT_META_TAGS = re.compile(r"<url>(.*?)</url>\s*<is_root>(true|false)</is_root>")
+# the shared analysis/ modules live one level up (and the frame index next to them, in sim/)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sim"))
+from etld1 import hostname_etld1
+from frame_index import FrameIndex
+from graphml_meta import get_graphml_meta
+
+SNIFF_THREADS = int(os.environ.get("SNIFF_THREADS", 16))
+FRAME_INDEX = os.environ.get("FRAME_INDEX")  # optional sim/frame_index.py database
 
 MetaTags = namedtuple('MetaTags', ['filename', 'url', 'etld1', 'is_root'])
 
 
 def get_meta_tags(filename: str) -> MetaTags:
-    with open(filename, "rt", encoding="utf8") as fd:
-        blob = fd.read()
-        m = RE_EXTRACT_META_TAGS.search(blob)
-        if not m:
-            raise ValueError("no tags found")
-        url = m.group(1)
-        ubits = urlparse(url)
-        etld1 = get_sld(ubits.hostname)
-        is_root = m.group(2) == "true"
-        return MetaTags(filename, url, etld1, is_root)
+    meta = get_graphml_meta(filename)
+    return MetaTags(filename, meta.url, hostname_etld1(urlparse(meta.url).hostname), meta.is_root)
+
+
+def indexed_meta_tags(index: FrameIndex, profile: str, site_tag: str) -> List[MetaTags]:
+    return [
+        MetaTags(fg.graph_file, fg.frame_url, hostname_etld1(urlparse(fg.frame_url).hostname), fg.is_root)
+        for fg in index.site_frames(profile, site_tag)]
 
 
 def main(argv):
@@ -36,6 +42,9 @@ def main(argv):
         print(f"usage: {argv[0]} ROOT_DIR [SITE_TAGS...]")
         return
     profiles = [d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))]
+    index = FrameIndex(FRAME_INDEX) if FRAME_INDEX else None
+    if index is not None:
+        index.refresh(root_dir)
 
     for site_tag in argv[2:]:
         try:
@@ -46,8 +55,13 @@ def main(argv):
                 for p in profiles:
                     cdir = os.path.join(root_dir, p, site_tag)
                     shutil.copytree(cdir, os.path.join(site_tag, p))
-                    graph_files = glob.glob(os.path.join(cdir, "*.graphml"))
-                    for mt in map(get_meta_tags, graph_files):
+                    if index is not None:
+                        meta_tags = indexed_meta_tags(index, p, site_tag)
+                    else:
+                        graph_files = glob.glob(os.path.join(cdir, "*.graphml"))
+                        with ThreadPoolExecutor(SNIFF_THREADS) as pool:
+                            meta_tags = list(pool.map(get_meta_tags, graph_files))
+                    for mt in meta_tags:
                         wc.writerow([p, os.path.basename(mt.filename), mt.is_root, mt.etld1, mt.url])
         except Exception as ex:
             logger.exception(f"failed to process '{site_tag}'")
@@ -1,19 +1,29 @@
 #!/usr/bin/env python3
+import argparse
 import hashlib
 import json
 import os
+import queue
 import random
 import re
+import shlex
+import shutil
 import signal
 import string
 import subprocess
 import sys
 import threading
 import time
+from collections import Counter, defaultdict, deque, namedtuple
 from urllib.parse import urlparse
 
 REPLACEX = re.compile(r"[^-_a-zA-Z0-9]")
 
+# crawl.log trouble signatures (same patterns errors.sh greps for)
+RE_LOG_ERROR = re.compile(r"^ERROR ")
+RE_LOG_FATAL = re.compile(r"FATAL:[^:][^:]*:.*")
+RE_LOG_PG_ASSERT = re.compile(r"\*PageGraph\* Assert failed: .*")
+
 TAG = os.environ.get("TAG", 'tag')
 PROFILE = os.environ.get("PROFILE", False)
 TIME_LIMIT = float(os.environ.get("TIME_LIMIT", 30.0))
@@ -22,91 +32,493 @@ TIME_TO_KILL = float(os.environ.get("TIME_TO_KILL", 5.0))
 BROWSER_EXE = os.environ.get("BROWSER_EXE", "/home/jjuecks/brave/Static/brave")
 NPM_CWD = os.environ.get("NPM_CWD", "/home/jjuecks/brave/pagegraph-crawl")
 CHROME_ARGS = json.loads(os.environ.get("CHROME_ARGS", "[]"))
+WORKERS = int(os.environ.get("WORKERS", 1))
+DIRECT = os.environ.get("DIRECT", "") not in ("", "0", "false")
+JOURNAL = os.environ.get("JOURNAL", "crawl.journal")
+LEDGER = os.environ.get("LEDGER", "crawl.ledger")
+FAIL_FAST = os.environ.get("FAIL_FAST", "") not in ("", "0", "false")
+ABORT_POLL = float(os.environ.get("ABORT_POLL", 0.5))
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", 2))
+ADAPTIVE = os.environ.get("ADAPTIVE", "") not in ("", "0", "false")
+ADAPTIVE_QUANTILE = float(os.environ.get("ADAPTIVE_QUANTILE", 0.95))
+ADAPTIVE_SLACK = float(os.environ.get("ADAPTIVE_SLACK", 1.5))
+ADAPTIVE_MIN_RUNS = int(os.environ.get("ADAPTIVE_MIN_RUNS", 3))
+ADAPTIVE_WINDOW = int(os.environ.get("ADAPTIVE_WINDOW", 50))
+HUNG_LIMIT = int(os.environ.get("HUNG_LIMIT", 3))
+# profile matrix as a JSON object of {TAG: PROFILE}, with null meaning a fresh profile ("-s down")
+PROFILES = json.loads(os.environ.get("PROFILES", "null")) or {TAG: PROFILE}
+# where worker<N>.log files go (default: the first profile's tree)
+LOG_DIR = os.environ.get("LOG_DIR") or next(iter(PROFILES))
+
+RunResult = namedtuple('RunResult', ['status', 'outcome', 'elapsed'])
+CrawlJob = namedtuple('CrawlJob', ['tag', 'profile', 'url'])
+Launcher = namedtuple('Launcher', ['argv', 'env'])
+LogSummary = namedtuple('LogSummary', ['errors', 'fatals', 'pg_asserts', 'first_fatal'])
+
+
+class CrawlAborted(Exception):
+    pass
+
+
+class LogClassifier:
+    """tees a crawler's output into its crawl.log, tallying ERROR/FATAL/PageGraph-assert lines as they arrive
+
+    With `fail_fast`, the first fatal signature sets `doomed` so the crawl can be put
+    down right away instead of waiting out its time-out.
+    """
+    def __init__(self, log_fd, fail_fast=False):
+        self.log_fd = log_fd
+        self.fail_fast = fail_fast
+        self.doomed = threading.Event()
+        self.errors = self.fatals = self.pg_asserts = 0
+        self.first_fatal = None
+        self.thread = None
+
+    def classify(self, line):
+        if RE_LOG_ERROR.match(line):
+            self.errors += 1
+        m = RE_LOG_PG_ASSERT.search(line)
+        if m:
+            self.pg_asserts += 1
+        else:
+            m = RE_LOG_FATAL.search(line)
+        if m:
+            self.fatals += 1
+            self.first_fatal = self.first_fatal or m.group(0).strip()
+            if self.fail_fast:
+                self.doomed.set()
+
+    def _pump(self, stream):
+        try:
+            for raw in iter(stream.readline, b""):
+                self.log_fd.write(raw)
+                self.classify(raw.decode("utf-8", errors="replace"))
+            self.log_fd.flush()
+        except ValueError:
+            pass # log closed under us (output still trickling in from an escaped process)
+
+    def follow(self, stream):
+        self.thread = threading.Thread(target=self._pump, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def finish(self, timeout):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    @property
+    def summary(self):
+        return LogSummary(self.errors, self.fatals, self.pg_asserts, self.first_fatal)
+
+
+def wait_or_abort(proc, time_out, abort=None):
+    """proc.wait(timeout=time_out), but raising CrawlAborted as soon as `abort` is set"""
+    if abort is None:
+        return proc.wait(timeout=time_out)
+    deadline = time.monotonic() + time_out
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(proc.args, time_out)
+        try:
+            return proc.wait(timeout=min(remaining, ABORT_POLL))
+        except subprocess.TimeoutExpired:
+            if abort.is_set():
+                raise CrawlAborted()
 
 
 def run_with_timeout(cmd_argv, **cmd_options):
     time_out_limit = cmd_options.pop("TIME_OUT", 60.0)
     time_to_kill_limit = cmd_options.pop("TIME_TO_KILL", 5.0)
+    log = cmd_options.pop("LOG", sys.stdout)
+    classifier = cmd_options.pop("CLASSIFIER", None)
+    if classifier is not None:
+        cmd_options["stdout"] = subprocess.PIPE
 
     status = None
+    outcome = "error"
+    start_time = time.monotonic()
     proc = subprocess.Popen(cmd_argv, start_new_session=True, **cmd_options)
+    if classifier is not None:
+        classifier.follow(proc.stdout)
     
     try:
-        status = proc.wait(timeout=time_out_limit)
+        status = wait_or_abort(proc, time_out_limit, classifier.doomed if classifier is not None else None)
         if status != 0:
-            print(f"ERROR: status={status}", flush=True)
-    except subprocess.TimeoutExpired:
+            print(f"ERROR: status={status}", file=log, flush=True)
+        else:
+            outcome = "ok"
+    except (subprocess.TimeoutExpired, CrawlAborted) as expired:
         proc.terminate() # soft-kill (to let node clean up the browser processes)
-        print("TIMEOUT", flush=True)
+        if isinstance(expired, CrawlAborted):
+            print(f"ABORTED: {classifier.first_fatal}", file=log, flush=True)
+            outcome = "aborted"
+        else:
+            print("TIMEOUT", file=log, flush=True)
+            outcome = "timeout"
         try:
             proc.wait(timeout=time_to_kill_limit)
         except subprocess.TimeoutExpired:
             os.killpg(proc.pid, signal.SIGKILL) # hard-kill the entire process group (which should include node and the browser?)
-            print("HARD-KILLED", flush=True)
+            print("HARD-KILLED", file=log, flush=True)
+            outcome = "hard-killed"
     except Exception as err:
-        print(f"FALLING-SKIES: error={err}", flush=True)
+        print(f"FALLING-SKIES: error={err}", file=log, flush=True)
         os.killpg(proc.pid, signal.SIGKILL) # hard-kill the entire process group (since this is something bad/fatal)
         raise
+    finally:
+        if classifier is not None:
+            classifier.finish(time_to_kill_limit)
     
-    return status
+    return RunResult(status, outcome, time.monotonic() - start_time)
 
 
-def main(argv):
-    if len(sys.argv) == 1:
-        print(f"usage: {argv[0]} [URL1 [URL2 [...]]]")
-        exit(2)
+class CrawlJournal:
+    """append-only JSON-lines log of crawl job states, keyed by the URL's MD5 tag
+
+    States are pending, running, ok, timeout, aborted, hard-killed, error, and
+    skipped; replaying the journal on startup tells us which URLs are finished
+    and which need another attempt, without having to rescan the collection tree.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.states = {}
+        self.attempts = Counter()
+        try:
+            with open(filename, "rt", encoding="utf-8") as fd:
+                for line in fd:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # torn final write from a crash
+                    self._apply(entry)
+        except FileNotFoundError:
+            pass
+        self.fd = open(filename, "at", encoding="utf-8")
+
+    def _apply(self, entry):
+        self.states[entry["tag"]] = entry["state"]
+        if entry["state"] == "running":
+            self.attempts[entry["tag"]] += 1
+
+    def record(self, random_tag, url, state, **extra):
+        self._write([dict(tag=random_tag, url=url, state=state, time=time.time(), **extra)])
+
+    def record_many(self, records):
+        """record() a batch of (random_tag, url, state) entries with a single flush and fsync"""
+        now = time.time()
+        self._write([dict(tag=random_tag, url=url, state=state, time=now) for random_tag, url, state in records])
+
+    def _write(self, entries):
+        if not entries:
+            return
+        with self.lock:
+            self.fd.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+            for entry in entries:
+                self._apply(entry)
+
+    def close(self):
+        self.fd.close()
+
+
+class CrawlLedger:
+    """append-only JSON-lines record of every finished crawl (one line per attempt; the last one for a site_tag wins)"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.fd = open(filename, "at", encoding="utf-8")
+
+    def record(self, **fields):
+        with self.lock:
+            self.fd.write(json.dumps(fields) + "\n")
+            self.fd.flush()
+
+    def close(self):
+        self.fd.close()
+
+
+def collection_stats(collection_dir):
+    graph_files = total_bytes = 0
+    for node, _, files in os.walk(collection_dir):
+        for f in files:
+            if f.endswith(".graphml"):
+                graph_files += 1
+            try:
+                total_bytes += os.path.getsize(os.path.join(node, f))
+            except OSError:
+                pass
+    return graph_files, total_bytes
+
 
-    for url in sys.argv[1:]:
-        hostname = urlparse(url).hostname
-        munged_url = REPLACEX.sub("_", url)[:64]
-        random_tag = hashlib.md5(url.encode('utf8')).hexdigest()
-        collection_dir = os.path.join(TAG, hostname, f"{munged_url}.{random_tag}")
+class TimeBudget:
+    """per-hostname kill deadlines learned from how long earlier crawls of the same host took
 
+    Hosts with enough successful crawls get a deadline of ADAPTIVE_SLACK times the
+    ADAPTIVE_QUANTILE of their recent wall times (clamped to [TIME_LIMIT, TIME_OUT]);
+    hosts that have hung HUNG_LIMIT times in a row without ever succeeding are skipped.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(lambda: deque(maxlen=ADAPTIVE_WINDOW))
+        self.hangs = Counter()
+
+    def replay(self, journal_filename):
         try:
-            os.makedirs(collection_dir, exist_ok=False)
-        except FileExistsError:
-            print(f"Ugh, duplicate URL: '{url}' (skipping)")
+            with open(journal_filename, "rt", encoding="utf-8") as fd:
+                for line in fd:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "elapsed" in entry:
+                        self.observe(urlparse(entry["url"]).hostname, entry["state"], entry["elapsed"])
+        except FileNotFoundError:
+            pass
+
+    def observe(self, hostname, outcome, elapsed):
+        with self.lock:
+            if outcome == "ok":
+                self.durations[hostname].append(elapsed)
+                self.hangs[hostname] = 0
+            elif outcome in ("timeout", "hard-killed"):
+                self.hangs[hostname] += 1
+
+    def is_hung(self, hostname):
+        with self.lock:
+            return self.hangs[hostname] >= HUNG_LIMIT and not self.durations.get(hostname)
+
+    def time_out(self, hostname):
+        with self.lock:
+            history = sorted(self.durations.get(hostname, ()))
+        if len(history) < ADAPTIVE_MIN_RUNS:
+            return TIME_OUT
+        quantile = history[round(ADAPTIVE_QUANTILE * (len(history) - 1))]
+        return min(TIME_OUT, max(TIME_LIMIT, quantile * ADAPTIVE_SLACK))
+
+
+def get_launcher(direct):
+    """how to start pagegraph-crawl: via `npm run crawl`, or (if `direct`) by running the package's "crawl" script ourselves
+
+    Going direct saves the npm startup and script resolution on every single URL.
+    """
+    if direct:
+        try:
+            with open(os.path.join(NPM_CWD, "package.json"), "rt", encoding="utf-8") as fd:
+                script = json.load(fd)["scripts"]["crawl"]
+            script_argv = shlex.split(script)
+            if any(t in ("&&", "||", ";", "|") for t in script_argv):
+                raise ValueError(f"script is a shell pipeline ({script})")
+        except (OSError, KeyError, ValueError) as err:
+            print(f"Can't run the crawl script directly ({err}); falling back to npm", flush=True)
+        else:
+            # npm puts the package's local bin dir on the PATH for scripts; so must we
+            env = dict(os.environ)
+            env["PATH"] = os.pathsep.join([os.path.join(NPM_CWD, "node_modules", ".bin"), env.get("PATH", "")])
+            return Launcher(script_argv, env)
+    return Launcher(["npm", "run", "crawl", "--"], None)
+
+
+def collection_dir_for(tag, url):
+    hostname = urlparse(url).hostname
+    munged_url = REPLACEX.sub("_", url)[:64]
+    random_tag = hashlib.md5(url.encode('utf8')).hexdigest()
+    return random_tag, os.path.join(tag, hostname, f"{munged_url}.{random_tag}")
+
+
+def plan_crawls(urls, journals):
+    """expand URLs into per-profile jobs, URL-major, so each URL is crawled under every profile close together in time"""
+    planned = []
+    pending = defaultdict(list)
+    seen = set()
+    tags = list(journals)
+    for url in urls:
+        if url in seen:
+            print(f"Ugh, duplicate URL: '{url}' (skipping)", flush=True)
             continue
+        seen.add(url)
+
+        # rotate the profile order per URL so no profile is systematically crawled first
+        shift = len(seen) % len(tags)
+        for tag in tags[shift:] + tags[:shift]:
+            journal = journals[tag]
+            random_tag, collection_dir = collection_dir_for(tag, url)
+            state = journal.states.get(random_tag)
+            if state is None and os.path.exists(collection_dir):
+                print(f"Ugh, duplicate URL: '{url}' in {tag} (not in journal; skipping)", flush=True)
+            elif state == "ok":
+                print(f"Already crawled '{url}' in {tag} (skipping)", flush=True)
+            elif state not in (None, "pending") and journal.attempts[random_tag] >= MAX_ATTEMPTS:
+                print(f"Giving up on '{url}' in {tag} after {journal.attempts[random_tag]} attempts (last={state})", flush=True)
+            else:
+                if state is None:
+                    pending[tag].append((random_tag, url, "pending"))
+                planned.append(CrawlJob(tag, PROFILES[tag], url))
+
+    # thousands of jobs: one fsync per journal, not one per job
+    for tag, records in pending.items():
+        journals[tag].record_many(records)
+    return planned
+
+
+def crawl_url(job, journal, ledger, launcher, budget=None, fail_fast=False, log=sys.stdout):
+    tag, profile, url = job
+    random_tag, collection_dir = collection_dir_for(tag, url)
+    hostname = urlparse(url).hostname
+    if budget is not None and budget.is_hung(hostname):
+        print(f"Skipping '{url}' in {tag} (host '{hostname}' keeps hanging)", file=log, flush=True)
+        journal.record(random_tag, url, "skipped")
+        return None
+    time_out = budget.time_out(hostname) if budget is not None else TIME_OUT
+
+    if journal.states.get(random_tag) is not None and os.path.exists(collection_dir):
+        # left over from a crashed/failed attempt (or from a driver that died after journaling
+        # "pending" but before "running"); start from a clean slate
+        print(f"Retrying '{url}' (discarding {collection_dir})", file=log, flush=True)
+        shutil.rmtree(collection_dir, ignore_errors=True)
+    os.makedirs(collection_dir, exist_ok=False)
 
-        log_filename = os.path.join(collection_dir, "crawl.log")
-        print(f"Crawling '{url}' (dir={collection_dir})...", flush=True)
-
-        cmd_argv = [
-            "npm",
-            "run",
-            "crawl",
-            "--",
-            "-b",
-            BROWSER_EXE,
-            "-o",
-            os.path.abspath(collection_dir),
-            "-t",
-            str(TIME_LIMIT),
-            "-u",
-            url,
-            "--debug=debug",
-            "-x",
-            json.dumps(CHROME_ARGS),
+    log_filename = os.path.join(collection_dir, "crawl.log")
+    print(f"Crawling '{url}' (dir={collection_dir})...", file=log, flush=True)
+
+    cmd_argv = launcher.argv + [
+        "-b",
+        BROWSER_EXE,
+        "-o",
+        os.path.abspath(collection_dir),
+        "-t",
+        str(TIME_LIMIT),
+        "-u",
+        url,
+        "--debug=debug",
+        "-x",
+        json.dumps(CHROME_ARGS),
+    ]
+
+    if profile in (None, False):
+        cmd_argv += [
+            "-s", "down"
+        ]
+    else:
+        cmd_argv += [
+            "-e", profile
         ]
 
-        if PROFILE == False:
-            cmd_argv += [
-                "-s", "down"
-            ]
-        else:
-            cmd_argv += [
-                "-e", PROFILE
-            ]
-
-        with open(log_filename, "wt", encoding="utf-8") as log:
-            cmd_options = {
-                "cwd": NPM_CWD,
-                "stdout": log,
-                "stderr": subprocess.STDOUT,
-                "TIME_OUT": TIME_OUT,
-                "TIME_TO_KILL": TIME_TO_KILL,
-            }
-            run_with_timeout(cmd_argv, **cmd_options)
+    with open(log_filename, "wb") as crawl_log:
+        classifier = LogClassifier(crawl_log, fail_fast=fail_fast)
+        cmd_options = {
+            "cwd": NPM_CWD,
+            "env": launcher.env,
+            "stderr": subprocess.STDOUT,
+            "CLASSIFIER": classifier,
+            "TIME_OUT": time_out,
+            "TIME_TO_KILL": TIME_TO_KILL,
+            "LOG": log,
+        }
+        journal.record(random_tag, url, "running")
+        try:
+            result = run_with_timeout(cmd_argv, **cmd_options)
+        except Exception:
+            journal.record(random_tag, url, "error")
+            raise
+
+    # ledger first: a crawl the journal calls finished always has its ledger record
+    summary = classifier.summary
+    graph_files, total_bytes = collection_stats(collection_dir)
+    ledger.record(
+        site_tag=os.path.relpath(collection_dir, tag),
+        url=url,
+        outcome=result.outcome,
+        status=result.status,
+        timed_out=result.outcome == "timeout" or (result.outcome == "hard-killed" and not classifier.doomed.is_set()),
+        aborted=result.outcome == "aborted" or (result.outcome == "hard-killed" and classifier.doomed.is_set()),
+        hard_killed=result.outcome == "hard-killed",
+        elapsed=result.elapsed,
+        graph_files=graph_files,
+        bytes=total_bytes,
+        errors=summary.errors,
+        fatals=summary.fatals,
+        pg_asserts=summary.pg_asserts,
+        first_fatal=summary.first_fatal,
+        time=time.time(),
+    )
+    journal.record(random_tag, url, result.outcome, status=result.status, elapsed=result.elapsed, time_out=time_out)
+    if budget is not None:
+        budget.observe(hostname, result.outcome, result.elapsed)
+    return result
+
+
+def crawl_worker(worker_id, job_queue, journals, ledgers, launcher, budget, fail_fast):
+    log_filename = os.path.join(LOG_DIR, f"worker{worker_id}.log")
+    with open(log_filename, "at", encoding="utf-8") as log:
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                crawl_url(job, journals[job.tag], ledgers[job.tag], launcher, budget, fail_fast, log=log)
+            except Exception as err:
+                print(f"FALLING-SKIES: tag={job.tag} url={job.url} error={err}", file=log, flush=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="drive pagegraph-crawl over a list of URLs")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help="number of concurrent crawl sessions")
+    parser.add_argument("--direct", action="store_true", default=DIRECT, help="run the crawl script without going through npm")
+    parser.add_argument("--adaptive", action="store_true", default=ADAPTIVE, help="learn per-host time-outs from past crawls and skip hosts that keep hanging")
+    parser.add_argument("--fail-fast", action="store_true", default=FAIL_FAST, help="put down a crawl as soon as its output shows a FATAL or PageGraph assert")
+    parser.add_argument("urls", metavar="URL", nargs="+")
+    args = parser.parse_args(argv[1:])
+
+    journals = {}
+    ledgers = {}
+    for tag in PROFILES:
+        os.makedirs(tag, exist_ok=True)
+        journals[tag] = CrawlJournal(os.path.join(tag, JOURNAL))
+        ledgers[tag] = CrawlLedger(os.path.join(tag, LEDGER))
+    jobs = plan_crawls(args.urls, journals)
+    launcher = get_launcher(args.direct)
+
+    budget = None
+    if args.adaptive:
+        # one budget across all profiles: a host that hangs under one profile usually hangs under all of them
+        budget = TimeBudget()
+        for journal in journals.values():
+            budget.replay(journal.filename)
+
+    if args.workers <= 1:
+        for job in jobs:
+            crawl_url(job, journals[job.tag], ledgers[job.tag], launcher, budget, args.fail_fast)
+        for journal, ledger in zip(journals.values(), ledgers.values()):
+            journal.close()
+            ledger.close()
+        return
+
+    # bounded pool: each worker thread pulls jobs and babysits one crawl child at a time
+    os.makedirs(LOG_DIR, exist_ok=True)
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+
+    workers = [threading.Thread(target=crawl_worker, args=(i, job_queue, journals, ledgers, launcher, budget, args.fail_fast), name=f"worker{i}") for i in range(args.workers)]
+    for w in workers:
+        w.start()
+    print(f"Crawling {len(jobs)} URL/profile jobs across {len(journals)} profiles with {len(workers)} workers (logs in {LOG_DIR}/worker*.log)...", flush=True)
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        # let in-flight crawls finish (or time out) but hand out no more URLs
+        print("Interrupted; draining job queue and waiting for in-flight crawls...", flush=True)
+        while not job_queue.empty():
+            job_queue.get_nowait()
+        for w in workers:
+            w.join()
+    for journal, ledger in zip(journals.values(), ledgers.values()):
+        journal.close()
+        ledger.close()
 
 
 if __name__ == "__main__":
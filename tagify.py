@@ -1,15 +1,79 @@
 #!/usr/bin/env python3
 import csv
 import hashlib
+import json
 import os
 import re
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
 from loguru import logger
 
 REPLACEX = re.compile(r"[^-_a-zA-Z0-9]")
-BOOMEX = re.compile(r"^ERROR |FATAL:", re.MULTILINE)
+BOOMEX = re.compile(rb"^ERROR |FATAL:", re.MULTILINE)
+
+TAGIFY_CACHE = os.environ.get("TAGIFY_CACHE", "tagify_cache.json")
+TAGIFY_THREADS = int(os.environ.get("TAGIFY_THREADS", 16))
+CHUNK_SIZE = 1 << 16
+
+
+class LogCache:
+    """crawl.log verdicts keyed by (path, size, mtime), so unchanged logs are never re-read"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        try:
+            with open(filename, "rt", encoding="utf8") as fd:
+                self.entries = json.load(fd)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, path, st):
+        size, mtime, failed = self.entries.get(path, (None, None, None))
+        if size == st.st_size and mtime == st.st_mtime_ns:
+            return failed
+        return None
+
+    def put(self, path, st, failed):
+        with self.lock:
+            self.entries[path] = (st.st_size, st.st_mtime_ns, failed)
+
+    def save(self):
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "wt", encoding="utf8") as fd:
+            json.dump(self.entries, fd)
+        os.replace(tmp_filename, self.filename)
+
+
+def scan_log(filename):
+    """stream through a log in chunks, stopping at the first ERROR/FATAL"""
+    tail = b""
+    with open(filename, "rb") as fd:
+        while True:
+            chunk = fd.read(CHUNK_SIZE)
+            if not chunk:
+                return bool(BOOMEX.search(tail))
+            # only search whole lines so "^" anchors (and matches) never straddle a chunk boundary
+            blob = tail + chunk
+            cut = blob.rfind(b"\n") + 1
+            if BOOMEX.search(blob, 0, cut):
+                return True
+            tail = blob[cut:]
+
+
+def check_log(filename, cache):
+    try:
+        st = os.stat(filename)
+        failed = cache.get(filename, st)
+        if failed is None:
+            failed = scan_log(filename)
+            cache.put(filename, st, failed)
+        return failed
+    except:
+        logger.exception("whoopsie")
+        return None
 
 
 def main(argv):
@@ -22,26 +86,26 @@ def main(argv):
     profiles = [d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))]
     profiles.sort()
 
-    wtr = csv.writer(sys.stdout)
-    wtr.writerow(['order', 'site_tag', 'crawl_url'] + profiles)
+    rows = []
     for order, line in enumerate(sys.stdin):
         url = line.strip()
         hostname = urlparse(url).hostname
         munged_url = REPLACEX.sub("_", url)[:64]
         random_tag = hashlib.md5(url.encode('utf8')).hexdigest()
         site_tag = os.path.join(hostname, f"{munged_url}.{random_tag}")
+        rows.append((order, site_tag, url))
+
+    cache = LogCache(TAGIFY_CACHE)
+    log_files = [os.path.join(root_dir, p, site_tag, "crawl.log") for _, site_tag, _ in rows for p in profiles]
+    with ThreadPoolExecutor(max_workers=TAGIFY_THREADS) as pool:
+        pfails = list(pool.map(lambda lf: check_log(lf, cache), log_files))
+    cache.save()
 
-        pfails = [None for _ in profiles]
-        for i, p in enumerate(profiles):
-            try:
-                with open(os.path.join(root_dir, p, site_tag, "crawl.log"), "r", encoding="utf8") as fd:
-                    blob = fd.read()
-                m = BOOMEX.search(blob)
-                pfails[i] = bool(m)
-            except:
-                logger.exception("whoopsie")
-        wtr.writerow([order, site_tag, url] + pfails)
+    wtr = csv.writer(sys.stdout)
+    wtr.writerow(['order', 'site_tag', 'crawl_url'] + profiles)
+    for i, row in enumerate(rows):
+        wtr.writerow(list(row) + pfails[i * len(profiles):(i + 1) * len(profiles)])
 
 
 if __name__ == "__main__":
-    main(sys.argv)
\ No newline at end of file
+    main(sys.argv)